@@ -1,4 +1,29 @@
 from .authentication import authenticate
 from .file_download import download_file_to, download_web_page
-from .tmp_file_system import create_temporary_directory
-from .polygon import GroupScoring, Group, FileContents, MemoryContents, Test, upload_groups
+from .tmp_file_system import create_temporary_directory, ScratchSpace, ScratchSpaceExceededException, scratch_space
+from .polygon import GroupScoring, Group, FileContents, BinaryFileContents, MemoryContents, Test, TestTable, upload_groups, \
+    with_retries, worker_pool, import_cancelled
+from .journal import Journal, JournaledProblem
+from .cli import split_arguments, parse_size, size_option, UsageError, configure_process, finish_import
+from .budget import ByteBudget, byte_budget
+from .validation import compile_validator, validate_tests, find_testlib, uses_testlib
+from .transaction import polygon_transaction, transaction_options, build_package
+from .profiling import PhaseProfiler, phase_profiler
+from .normalization import TestNormalizer, normalize_stream
+from .cassette import Cassette, install_cassette
+from .credentials import Credential, CredentialPool, CredentialsExhaustedException, ShardedPolygon, pinned_client
+from .resources import ResourceOptimizer, is_build_artefact, recompress_png
+from .pipeline import (
+    ImportAbortedException,
+    FileItem,
+    SolutionItem,
+    StatementItem,
+    ResourceItem,
+    ValidatorTestItem,
+    CheckerTestItem,
+    SourceAdapter,
+    ImportReport,
+    ImportPipeline,
+    run_import,
+    find_problem,
+)
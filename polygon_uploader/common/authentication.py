@@ -2,6 +2,8 @@ import os
 import yaml
 from polygon_api import Polygon
 
+from .credentials import Credential, sharded_client
+
 
 def authenticate():
     default_polygon_url = "https://polygon.codeforces.com"
@@ -16,6 +18,8 @@ def authenticate():
         polygon_url = auth_data.get('polygon_url', default_polygon_url)
         api_key = auth_data.get('api_key')
         api_secret = auth_data.get('api_secret')
+        if auth_data.get('profiles'):
+            return profiles_client(polygon_url, auth_data['profiles'])
 
     if not os.path.exists(authentication_file) or not api_key or not api_secret:
         print('WARNING: Authentication data will be stored in plain text in {}'.format(authentication_file))
@@ -33,3 +37,25 @@ def authenticate():
         print('Authentication data is stored in {}'.format(authentication_file))
     polygon_url += '/api'
     return Polygon(polygon_url, api_key, api_secret)
+
+
+def profiles_client(polygon_url, profiles):
+    """
+    Builds a client over the keys of the profiles section, requests are spread across them
+    """
+    credentials = []
+    for index, profile in enumerate(profiles):
+        if not profile.get('api_key') or not profile.get('api_secret'):
+            print('WARNING: profile {} has no api_key or api_secret, skipped'.format(profile.get('name', index)))
+            continue
+        requests_per_minute = profile.get('requests_per_minute')
+        credentials.append(Credential(profile.get('name', profile['api_key'][:8]),
+                                      profile.get('polygon_url', polygon_url) + '/api',
+                                      profile['api_key'], profile['api_secret'],
+                                      int(requests_per_minute) if requests_per_minute else None))
+    if len(credentials) == 0:
+        raise ValueError('No usable profiles in the authentication file')
+    if len(credentials) == 1:
+        config = credentials[0].config
+        return Polygon(config.api_url, config.api_key, config.api_secret)
+    return sharded_client(credentials)
@@ -0,0 +1,94 @@
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from .polygon import GroupScoring, Group, FileContents, Test, TestTable, upload_groups
+
+SAMPLES = 3
+SUBTASKS = 10
+
+
+class BenchmarkProblem:
+    """
+    Takes the place of a Polygon problem in upload_groups, counts the saved tests instead of uploading them
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tests = 0
+        self.points = 0
+
+    def save_test(self, testset, test_index, test_input, test_points=None, **kwargs):
+        with self.lock:
+            self.tests += 1
+            self.points += test_points
+
+    def save_test_group(self, testset, group, **kwargs):
+        pass
+
+
+def split(count):
+    size = (count - SAMPLES) // SUBTASKS
+    bounds = [SAMPLES + size * i for i in range(SUBTASKS)] + [count]
+    return [(0, SAMPLES, 0, GroupScoring.SUM)] + \
+           [(bounds[i], bounds[i + 1], 100 // SUBTASKS, GroupScoring.GROUP) for i in range(SUBTASKS)]
+
+
+def describe(path):
+    return 'benchmark: %s' % path
+
+
+def write_tests(directory, count):
+    paths = [os.path.join(directory, '%06d.in' % i) for i in range(count)]
+    for i, path in enumerate(paths):
+        with open(path, 'w') as f:
+            f.write('%d\n' % i)
+    return paths
+
+
+def build_lists(paths):
+    return [Group(score, [Test(FileContents(path), describe(path)) for path in paths[first:last]], scoring)
+            for first, last, score, scoring in split(len(paths))]
+
+
+def build_tables(paths):
+    return [Group(score, TestTable(paths[first:last], describe), scoring)
+            for first, last, score, scoring in split(len(paths))]
+
+
+def measure(name, build, paths, workers):
+    tracemalloc.start()
+    start = time.perf_counter()
+    groups = build(paths)
+    built = time.perf_counter()
+    _, build_peak = tracemalloc.get_traced_memory()
+    prob = BenchmarkProblem()
+    # the same path as a real import, with the per-test log lines thrown away
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        upload_groups(prob, groups, workers)
+    uploaded = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-6s %d tests, %d points: build %.3f s (peak %.1f MB), upload %.3f s (peak %.1f MB)"
+          % (name, prob.tests, prob.points, built - start, build_peak / 2 ** 20, uploaded - built, peak / 2 ** 20))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    directory = tempfile.mkdtemp(prefix='__benchmark')
+    try:
+        paths = write_tests(directory, count)
+        measure("lists", build_lists, paths, workers)
+        measure("tables", build_tables, paths, workers)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
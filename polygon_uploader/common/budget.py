@@ -0,0 +1,41 @@
+import threading
+from contextlib import contextmanager
+
+
+class ByteBudget:
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def _fits(self, size):
+        # a payload larger than the whole budget is let through once nothing else is in flight
+        return self.limit is None or self.in_flight == 0 or self.in_flight + size <= self.limit
+
+    def acquire(self, size):
+        with self.condition:
+            # every waiter rechecks its own size, so a small payload is not stuck behind a big one
+            self.condition.wait_for(lambda: self._fits(size))
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size):
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    def report(self):
+        print("Peak in-flight payload: %d bytes (budget: %s)"
+              % (self.peak, "unlimited" if self.limit is None else "%d bytes" % self.limit))
+
+
+byte_budget = ByteBudget()
@@ -0,0 +1,157 @@
+import atexit
+import datetime
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+INTERACTIONS_FILE = 'interactions.jsonl'
+BODIES_DIRECTORY = 'bodies/'
+# fields of signed Polygon API requests that change on every call
+VOLATILE_FIELDS = {b'apiKey', b'time', b'apiSig'}
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+FIELD_NAME = re.compile(rb'name="([^"]*)"')
+
+
+def form_fields(request):
+    boundary = re.search(r'boundary=([^;]+)', request.headers.get('Content-Type', ''))
+    if boundary is None or request.body is None:
+        return None
+    fields = []
+    for part in request.body.split(b'--' + boundary.group(1).encode('ascii')):
+        headers, separator, value = part.partition(b'\r\n\r\n')
+        name = FIELD_NAME.search(headers)
+        if separator and name is not None:
+            fields.append((name.group(1), value[:-2] if value.endswith(b'\r\n') else value))
+    return fields
+
+
+def request_key(request):
+    """
+    Identifies a request by its method, URL and body, without the signature of Polygon API requests
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('ascii') + b' ' + request.url.encode('utf-8') + b'\n')
+    fields = form_fields(request)
+    if fields is not None:
+        for name, value in sorted(field for field in fields if field[0] not in VOLATILE_FIELDS):
+            digest.update(name + b'=' + hashlib.sha256(value).digest() + b'\n')
+    elif request.body is not None:
+        body = request.body if isinstance(request.body, bytes) else str(request.body).encode('utf-8')
+        digest.update(body)
+    return digest.hexdigest()
+
+
+class Cassette:
+    """
+    Records every HTTP request of the process (web pages, archives and Polygon API calls) into a zip file,
+    or serves them back from it without touching the network.
+    In the replay mode the responses to the same request are served in the recorded order, the last one is repeated.
+    """
+
+    def __init__(self, path, replay=False, latency=None):
+        self.path = path
+        self.replay = replay
+        # None -- no delay, 'recorded' -- the recorded time of every response, a number -- seconds per response
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.interactions = {}
+        self.bodies = set()
+        self.recorded = []
+        if replay:
+            self.zip_file = zipfile.ZipFile(path, 'r')
+            with self.zip_file.open(INTERACTIONS_FILE) as f:
+                for line in f:
+                    interaction = json.loads(line)
+                    self.interactions.setdefault(interaction['key'], deque()).append(interaction)
+            print("Replaying %d recorded requests from %s" % (sum(map(len, self.interactions.values())), path))
+        else:
+            self.zip_file = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+            print("Recording all requests to %s" % path)
+
+    def install(self):
+        send = HTTPAdapter.send
+        cassette = self
+
+        def cassette_send(adapter, request, **kwargs):
+            if cassette.replay:
+                return cassette.play(request)
+            return cassette.record(send, adapter, request, **kwargs)
+
+        HTTPAdapter.send = cassette_send
+        atexit.register(self.close)
+
+    def record(self, send, adapter, request, **kwargs):
+        start = time.perf_counter()
+        response = send(adapter, request, **kwargs)
+        body = response.content
+        elapsed = time.perf_counter() - start
+        body_hash = hashlib.sha256(body).hexdigest()
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        with self.lock:
+            if body_hash not in self.bodies:
+                self.bodies.add(body_hash)
+                self.zip_file.writestr(BODIES_DIRECTORY + body_hash, body)
+            self.recorded.append({'key': request_key(request), 'method': request.method, 'url': request.url,
+                                  'status': response.status_code, 'reason': response.reason, 'headers': headers,
+                                  'body': body_hash, 'elapsed': round(elapsed, 6)})
+        return response
+
+    def play(self, request):
+        key = request_key(request)
+        with self.lock:
+            queue = self.interactions.get(key)
+            if not queue:
+                raise requests.ConnectionError("%s %s is not recorded in %s" % (request.method, request.url,
+                                                                                self.path))
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+            body = self.zip_file.read(BODIES_DIRECTORY + interaction['body'])
+        if self.latency == 'recorded':
+            time.sleep(interaction['elapsed'])
+        elif self.latency is not None:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction['reason']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response.headers['Content-Length'] = str(len(body))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(seconds=interaction['elapsed'])
+        return response
+
+    def close(self):
+        with self.lock:
+            if self.zip_file is None:
+                return
+            if not self.replay:
+                self.zip_file.writestr(INTERACTIONS_FILE, "".join(json.dumps(x) + "\n" for x in self.recorded))
+                print("Recorded %d requests with %d distinct bodies to %s" % (len(self.recorded), len(self.bodies),
+                                                                              self.path))
+            self.zip_file.close()
+            self.zip_file = None
+
+
+def install_cassette(options):
+    if 'record' in options:
+        cassette = Cassette(options['record'])
+    elif 'replay' in options:
+        latency = options.get('replay-latency')
+        if latency is not None and latency != 'recorded':
+            latency = float(latency)
+        cassette = Cassette(options['replay'], replay=True, latency=latency)
+    else:
+        return None
+    cassette.install()
+    return cassette
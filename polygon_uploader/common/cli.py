@@ -0,0 +1,73 @@
+from .budget import byte_budget
+from .cassette import install_cassette
+from .polygon import ImportAbortedException
+
+
+def split_arguments(argv):
+    arguments = []
+    options = {}
+    for arg in argv:
+        if arg.startswith('--'):
+            name, has_value, value = arg[2:].partition('=')
+            options[name] = value if has_value else True
+        else:
+            arguments.append(arg)
+    return arguments, options
+
+
+SIZE_SUFFIXES = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+
+
+class UsageError(Exception):
+    pass
+
+
+def parse_size(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("no size is given")
+    value = value.strip().upper().rstrip('B')
+    if value[-1:] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def size_option(options, name):
+    """
+    The size of --<name>=<size>, a bare or malformed option is a UsageError
+    """
+    try:
+        return parse_size(options[name])
+    except ValueError:
+        raise UsageError("--%s expects a size in bytes, e.g. --%s=512M" % (name, name))
+
+
+def configure_process(options, print_usage):
+    """
+    Applies the process-wide options of an import command (memory budget, scratch space, cassette) and installs
+    the signal handlers, a malformed option prints the usage and exits
+    """
+    # the scratch space reads its sizes with size_option, so it is imported only when it is used
+    from .tmp_file_system import scratch_space
+    try:
+        if 'memory-budget' in options:
+            byte_budget.limit = size_option(options, 'memory-budget')
+        scratch_space.configure(options)
+    except UsageError as e:
+        print(e)
+        print_usage()
+        exit(239)
+    scratch_space.install_handlers()
+    install_cassette(options)
+
+
+def finish_import(report):
+    """
+    Prints the report of an import run by a command, exits with 1 if the import was stopped
+    """
+    if isinstance(report.exception, ImportAbortedException):
+        print(report.exception.comment)
+        exit(1)
+    if report.exception is not None:
+        raise report.exception
+    report.print_summary()
+    byte_budget.report()
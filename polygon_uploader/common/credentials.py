@@ -0,0 +1,261 @@
+import atexit
+import re
+import threading
+import time
+from collections import deque
+
+from polygon_api import (
+    Polygon,
+    HTTPRequestFailedException,
+    PolygonRequestFailedException,
+)
+from polygon_api.api import Request, RequestConfig, Response
+
+RATE_WINDOW = 60
+THROTTLE_COOLDOWN = 60
+MAX_THROTTLE_COOLDOWN = 15 * 60
+THROTTLED_HTTP_CODES = {429, 503}
+# 403 may only mean that this account cannot access the problem, it is a failure of the request
+REVOKED_HTTP_CODES = {401}
+HTTP_CODE = re.compile(r'HTTP code (\d+)')
+# comments of FAILED responses that are about the key and not about the request itself,
+# a bad signature (e.g. clock skew) or no access to a problem fail only the request
+THROTTLED_COMMENT = re.compile(r'too many|rate limit|limit exceeded|try again later', re.IGNORECASE)
+REVOKED_COMMENT = re.compile(r'\b(incorrect|invalid|unknown|wrong|revoked|blocked|disabled|expired)\s+api\s*key\b|'
+                             r'\bapi\s*key\s+(is\s+|was\s+|has\s+been\s+)?'
+                             r'(incorrect|invalid|unknown|wrong|revoked|blocked|disabled|expired)\b', re.IGNORECASE)
+# methods that do not change the working copy, every other method does
+READ_ONLY_METHODS = {
+    'problems.list', 'contest.problems', 'problem.info', 'problem.cautions', 'problem.statements',
+    'problem.statementResources', 'problem.checker', 'problem.validator', 'problem.extraValidators',
+    'problem.interactor', 'problem.files', 'problem.solutions', 'problem.script', 'problem.tests',
+    'problem.testInput', 'problem.testAnswer', 'problem.validatorTests', 'problem.checkerTests', 'problem.packages',
+    'problem.package', 'problem.renderStatements', 'problem.viewFile', 'problem.viewSolution',
+    'problem.viewStatementResource', 'problem.viewTags', 'problem.viewTestGroup', 'problem.viewGeneralDescription',
+    'problem.viewGeneralTutorial',
+}
+
+
+class CredentialsExhaustedException(PolygonRequestFailedException):
+    pass
+
+
+class ThrottledException(Exception):
+    pass
+
+
+class RevokedException(Exception):
+    pass
+
+
+class Pin:
+    """
+    The key that sends the requests of one problem. Polygon keeps a working copy per user, so another key may take
+    over only until the first modifying request, after that the key is fixed.
+    """
+    __slots__ = ('credential', 'fixed')
+
+    def __init__(self):
+        self.credential = None
+        self.fixed = False
+
+
+class Credential:
+    __slots__ = ('name', 'config', 'requests_per_minute', 'recent', 'in_flight', 'requests', 'throttles',
+                 'throttled_until', 'cooldown', 'revoked')
+
+    def __init__(self, name, api_url, api_key, api_secret, requests_per_minute=None):
+        self.name = name
+        self.config = RequestConfig(api_url, api_key, api_secret)
+        self.requests_per_minute = requests_per_minute
+        self.recent = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.throttles = 0
+        self.throttled_until = 0
+        self.cooldown = THROTTLE_COOLDOWN
+        self.revoked = False
+
+    def available_at(self, now):
+        """
+        The time from which the key may send the next request, None if it is revoked
+        """
+        if self.revoked:
+            return None
+        while self.recent and self.recent[0] <= now - RATE_WINDOW:
+            self.recent.popleft()
+        at = self.throttled_until
+        if self.requests_per_minute is not None and len(self.recent) >= self.requests_per_minute:
+            at = max(at, self.recent[len(self.recent) - self.requests_per_minute] + RATE_WINDOW)
+        return at
+
+
+class CredentialPool:
+    """
+    Spreads Polygon API requests over several keys. Every key is used within its own rate limit,
+    a throttled key is put aside for a growing cooldown, a revoked key is dropped,
+    and the request is sent again with another key.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.condition = threading.Condition()
+        self.failovers = 0
+
+    def acquire(self, pin=None, modifying=False):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                ready = []
+                earliest = None
+                fixed = pin is not None and pin.fixed
+                for credential in [pin.credential] if fixed else self.credentials:
+                    at = credential.available_at(now)
+                    if at is None:
+                        continue
+                    if at <= now:
+                        ready.append(credential)
+                    elif earliest is None or at < earliest:
+                        earliest = at
+                if ready:
+                    if pin is not None and pin.credential in ready:
+                        credential = pin.credential
+                    else:
+                        credential = min(ready, key=lambda c: (c.in_flight, len(c.recent)))
+                    if pin is not None:
+                        pin.credential = credential
+                        pin.fixed = fixed or modifying
+                    credential.recent.append(now)
+                    credential.in_flight += 1
+                    credential.requests += 1
+                    return credential
+                if fixed and earliest is None:
+                    raise CredentialsExhaustedException("API key %s is revoked, the changes made with it are left in "
+                                                        "its working copy" % pin.credential.name)
+                if earliest is None:
+                    raise CredentialsExhaustedException("All %d API keys are revoked" % len(self.credentials))
+                self.condition.wait(earliest - now)
+
+    def release(self, credential, throttled=False, revoked=False):
+        with self.condition:
+            credential.in_flight -= 1
+            if revoked:
+                print("API key %s is revoked, it is not used anymore" % credential.name)
+                credential.revoked = True
+                self.failovers += 1
+            elif throttled:
+                print("API key %s is throttled, it is not used for %d s" % (credential.name, credential.cooldown))
+                credential.throttles += 1
+                credential.throttled_until = time.monotonic() + credential.cooldown
+                credential.cooldown = min(2 * credential.cooldown, MAX_THROTTLE_COOLDOWN)
+                self.failovers += 1
+            else:
+                credential.cooldown = THROTTLE_COOLDOWN
+            self.condition.notify_all()
+
+    def issue(self, action, pin=None, modifying=False):
+        """
+        Calls action(request_config) with the configs of the keys until a key is neither throttled nor revoked,
+        only with the key of the pin once it is fixed
+        """
+        while True:
+            credential = self.acquire(pin, modifying)
+            try:
+                result = action(credential.config)
+            except ThrottledException:
+                self.release(credential, throttled=True)
+                continue
+            except RevokedException:
+                self.release(credential, revoked=True)
+                continue
+            except HTTPRequestFailedException as e:
+                code = HTTP_CODE.search(str(e))
+                code = int(code.group(1)) if code is not None else None
+                self.release(credential, throttled=code in THROTTLED_HTTP_CODES,
+                             revoked=code in REVOKED_HTTP_CODES)
+                if code in THROTTLED_HTTP_CODES or code in REVOKED_HTTP_CODES:
+                    continue
+                raise
+            except PolygonRequestFailedException as e:
+                comment = str(getattr(e, 'comment', e) or '')
+                self.release(credential, throttled=THROTTLED_COMMENT.search(comment) is not None,
+                             revoked=REVOKED_COMMENT.search(comment) is not None)
+                if THROTTLED_COMMENT.search(comment) or REVOKED_COMMENT.search(comment):
+                    continue
+                raise
+            except BaseException:
+                self.release(credential)
+                raise
+            self.release(credential)
+            return result
+
+    def print_summary(self):
+        print("API keys: %d failovers" % self.failovers)
+        for credential in self.credentials:
+            state = "revoked" if credential.revoked else "active"
+            print("  %-16s %8d requests %4d throttles  %s" % (credential.name, credential.requests,
+                                                              credential.throttles, state))
+
+
+def checked_response(response):
+    if response.status == Response.STATUS_FAILED:
+        if THROTTLED_COMMENT.search(response.comment or ''):
+            raise ThrottledException(response.comment)
+        if REVOKED_COMMENT.search(response.comment or ''):
+            raise RevokedException(response.comment)
+    return response
+
+
+class ShardedPolygon(Polygon):
+    """
+    Polygon client over the API keys of the pool. Without a pin every request goes with any key, so only read-only
+    requests are allowed; the client of pinned() sends all requests of a problem with one key.
+    """
+
+    def __init__(self, pool, pin=None):
+        first = pool.credentials[0].config
+        super().__init__(first.api_url, first.api_key, first.api_secret)
+        self.pool = pool
+        self.pin = pin
+
+    def pinned(self):
+        return ShardedPolygon(self.pool, Pin())
+
+    def issue(self, method_name, action):
+        modifying = method_name not in READ_ONLY_METHODS
+        if modifying and self.pin is None:
+            raise PolygonRequestFailedException("%s changes the problem, it needs a client pinned to one API key"
+                                                % method_name)
+        return self.pool.issue(action, self.pin, modifying)
+
+    def _request(self, method_name, args=None):
+        return self.issue(method_name, lambda config: checked_response(Request(config, method_name, args).issue()))
+
+    def _request_text(self, method_name, args=None):
+        return self.issue(method_name, lambda config: Request(config, method_name, args).issue_text())
+
+    def _request_raw(self, method_name, args=None):
+        return self.issue(method_name, lambda config: Request(config, method_name, args).issue_raw())
+
+
+def with_request_config(api, action):
+    """
+    Calls action(request_config) with a key of the client, using the pool of a sharded client
+    """
+    if isinstance(api, ShardedPolygon):
+        return api.pool.issue(action, api.pin)
+    return action(api.request_config)
+
+
+def pinned_client(api):
+    """
+    The client for the requests of one problem, all of them go with the same key of a sharded client
+    """
+    return api.pinned() if isinstance(api, ShardedPolygon) else api
+
+
+def sharded_client(credentials):
+    pool = CredentialPool(credentials)
+    print("Using %d API keys: %s" % (len(credentials), ", ".join(c.name for c in credentials)))
+    atexit.register(pool.print_summary)
+    return ShardedPolygon(pool)
@@ -1,10 +1,26 @@
 import requests
 import progressbar
 import os
+import time
+from polygon_api import (
+    HTTPRequestFailedException,
+    PolygonRequestFailedException,
+)
+from polygon_api.api import Request
+
+from .credentials import with_request_config
+from .polygon import ImportAbortedException
+
+POOL_SIZE = 32
+CHUNK_SIZE = 1 << 16
+
+session = requests.Session()
+session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
 
 
 def download_file_to(link, path):
-    r = requests.get(link, stream=True)
+    r = session.get(link, stream=True)
     if r.status_code != 200:
         print(r.status_code, link)
         return False
@@ -28,10 +44,38 @@ def download_file_to(link, path):
     return True
 
 
+def download_polygon_to(api, method_name, args, path):
+    """
+    Issues a Polygon API method that returns a file and streams it to path through the pooled session
+    """
+    return with_request_config(api, lambda config: download_polygon_with(config, method_name, args, path))
+
+
+def download_polygon_with(config, method_name, args, path):
+    request = Request(config, method_name, args)
+    # signed the same way as Request.issue does it, which keeps the whole body in memory
+    signed = Request._encoded_args(list(request.args) + [('apiKey', config.api_key), ('time', str(int(time.time())))])
+    signed.append((b'apiSig', request.get_api_signature(signed, Request._value_to_utf8_bytes(config.api_secret))))
+    with session.post(config.api_url + method_name, files=signed, stream=True) as r:
+        if r.status_code == 400:
+            raise PolygonRequestFailedException(r.json().get('comment'))
+        if r.status_code != 200:
+            raise HTTPRequestFailedException('Method %s returned HTTP code %d' % (method_name, r.status_code))
+        partial = path + '.part'
+        try:
+            with open(partial, 'wb') as f:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            os.remove(partial)
+            raise
+        os.replace(partial, path)
+    return os.path.getsize(path)
+
+
 def download_web_page(link):
-    r = requests.get(link)
+    r = session.get(link)
     if r.status_code != 200:
-        print(r.status_code, "error")
-        exit(1)
+        raise ImportAbortedException("Failed to download %s: HTTP code %d" % (link, r.status_code))
     return r.text
 
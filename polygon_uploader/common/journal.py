@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from enum import Enum
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks on Windows, two processes importing the same problem are not kept apart there
+    fcntl = None
+
+JOURNAL_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'polygon_uploader', 'journal')
+
+
+def is_journaled_method(name):
+    return name.startswith(('save_', 'set_', 'enable_', 'edit_')) or name == 'update_info'
+
+
+def _fingerprint(hasher, value):
+    if isinstance(value, bytes):
+        hasher.update(b'b%d:' % len(value))
+        hasher.update(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        hasher.update(b's%d:' % len(data))
+        hasher.update(data)
+    elif isinstance(value, Enum) or isinstance(value, (bool, int, float)) or value is None:
+        hasher.update(('v%s:' % repr(str(value))).encode('utf-8'))
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b'l%d:' % len(value))
+        for item in value:
+            _fingerprint(hasher, item)
+    elif isinstance(value, dict):
+        hasher.update(b'd%d:' % len(value))
+        for key in sorted(value):
+            _fingerprint(hasher, key)
+            _fingerprint(hasher, value[key])
+    else:
+        hasher.update(('o%s:' % type(value).__name__).encode('utf-8'))
+        _fingerprint(hasher, vars(value))
+
+
+def operation_hash(method, args, kwargs):
+    hasher = hashlib.sha256()
+    _fingerprint(hasher, method)
+    _fingerprint(hasher, list(args))
+    _fingerprint(hasher, kwargs)
+    return hasher.hexdigest()
+
+
+class Journal:
+    """
+    Operations done on one problem since its last commit, kept in a file of its own.
+    The file is locked while it is read or written, and removed once the changes are committed.
+    """
+
+    def __init__(self, problem_id, resume=False, directory=JOURNAL_DIRECTORY):
+        self.problem_id = str(problem_id)
+        self.path = os.path.join(directory, '%s.jsonl' % self.problem_id)
+        self.lock = threading.Lock()
+        self.done = set()
+        os.makedirs(directory, exist_ok=True)
+        if resume:
+            self._load()
+            print("Journal: resuming problem %s, %d operations already done" % (self.problem_id, len(self.done)))
+        else:
+            self.reset()
+
+    @contextmanager
+    def _open(self, mode):
+        with open(self.path, mode) as fs:
+            if fcntl is not None:
+                fcntl.flock(fs.fileno(), fcntl.LOCK_EX)
+            try:
+                yield fs
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fs.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with self._open('r+b') as fs:
+            data = fs.read()
+            # appends hold the lock, so an incomplete last line is left by a process that died while writing it
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                print("Journal: dropping torn record at the end of %s" % self.path)
+                fs.truncate(complete)
+                fs.flush()
+                os.fsync(fs.fileno())
+        for line in data[:complete].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'op' in record:
+                self.done.add(record['op'])
+
+    def _append(self, record):
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self._open('ab') as fs:
+            fs.write(line)
+            fs.flush()
+            os.fsync(fs.fileno())
+
+    def reset(self):
+        with self.lock:
+            self.done.clear()
+            with self._open('ab') as fs:
+                fs.truncate(0)
+
+    def clear(self):
+        """
+        Forgets the problem after its changes are committed
+        """
+        with self.lock:
+            self.done.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def is_done(self, op):
+        with self.lock:
+            return op in self.done
+
+    def record(self, op, method):
+        with self.lock:
+            self._append({'problem': self.problem_id, 'op': op, 'method': method})
+            self.done.add(op)
+
+
+class JournaledProblem:
+    def __init__(self, prob, journal):
+        self._prob = prob
+        self._journal = journal
+
+    def __getattr__(self, name):
+        attribute = getattr(self._prob, name)
+        if not callable(attribute) or not is_journaled_method(name):
+            return attribute
+
+        def journaled(*args, **kwargs):
+            op = operation_hash(name, args, kwargs)
+            if self._journal.is_done(op):
+                print("Journal: %s already done, skipped" % name)
+                return None
+            result = attribute(*args, **kwargs)
+            self._journal.record(op, name)
+            return result
+
+        return journaled
@@ -0,0 +1,137 @@
+import io
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .polygon import FileContents, MemoryContents
+from .tmp_file_system import scratch_space
+
+CHUNK_SIZE = 1 << 20
+CR_TO_LF = bytes.maketrans(b'\r', b'\n')
+TRAILING_SPACES = re.compile(rb'[ \t]+(?=\n)')
+
+
+def normalize_stream(source, destination, strip_spaces=False, chunk_size=CHUNK_SIZE):
+    """
+    Copies source to destination chunk by chunk, turning CRLF and CR into LF, adding the missing final newline
+    and, if strip_spaces is set, removing spaces and tabs at the ends of lines. Returns the list of the fixes made.
+    """
+    fixes = set()
+    # a CR (or spaces) at the end of a chunk may be followed by a LF in the next one, so it is carried over
+    tail = b'\r \t' if strip_spaces else b'\r'
+    carry = b''
+    last = b''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + chunk
+        cut = len(data.rstrip(tail))
+        data, carry = data[:cut], data[cut:]
+        fixed = fix_chunk(data, strip_spaces, fixes)
+        destination.write(fixed)
+        if fixed:
+            last = fixed[-1:]
+    if carry:
+        fixed = fix_chunk(carry, strip_spaces, fixes)
+        if strip_spaces and fixed.rstrip(b' \t') != fixed:
+            fixes.add('trailing spaces')
+            fixed = fixed.rstrip(b' \t')
+        destination.write(fixed)
+        if fixed:
+            last = fixed[-1:]
+    if last and last != b'\n':
+        fixes.add('final newline')
+        destination.write(b'\n')
+    return sorted(fixes)
+
+
+def fix_chunk(data, strip_spaces, fixes):
+    fixed = data.replace(b'\r\n', b'\n').translate(CR_TO_LF)
+    if fixed != data:
+        fixes.add('line endings')
+    if strip_spaces:
+        stripped = TRAILING_SPACES.sub(b'', fixed)
+        if stripped != fixed:
+            fixes.add('trailing spaces')
+        fixed = stripped
+    return fixed
+
+
+class TestNormalizer:
+    """
+    Normalizes tests in a thread pool ahead of their upload, changed file tests are written to a scratch directory
+    """
+
+    def __init__(self, strip_spaces=False, workers=4, lookahead=None, wrap=None):
+        self.strip_spaces = strip_spaces
+        self.task = self.normalize_test if wrap is None else wrap(self.normalize_test)
+        self.workers = workers
+        self.lookahead = lookahead if lookahead is not None else 2 * workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.directory = None
+        self.lock = threading.Lock()
+        self.changed = []
+
+    def get_directory(self):
+        with self.lock:
+            if self.directory is None:
+                self.directory = scratch_space.create_directory("__normalized")
+            return self.directory
+
+    def normalize_test(self, test, test_index):
+        content = test.content
+        if isinstance(content, FileContents):
+            path = os.path.join(self.get_directory(), "%d.in" % test_index)
+            with open(content.path, 'rb') as source, open(path, 'wb') as destination:
+                fixes = self.normalize(source, destination)
+            if fixes:
+                scratch_space.charge(os.path.getsize(path))
+                test.content = type(content)(path)
+            else:
+                os.remove(path)
+        elif isinstance(content, MemoryContents):
+            data = content()
+            is_text = isinstance(data, str)
+            destination = io.BytesIO()
+            fixes = self.normalize(io.BytesIO(data.encode('utf-8') if is_text else data), destination)
+            if fixes:
+                data = destination.getvalue()
+                test.content = MemoryContents(data.decode('utf-8') if is_text else data)
+        else:
+            return test
+        if fixes:
+            print("Test %d [%s] normalized: %s" % (test_index, test.description, ", ".join(fixes)))
+            with self.lock:
+                self.changed.append((test_index, test.description, fixes))
+        return test
+
+    def normalize(self, source, destination):
+        return normalize_stream(source, destination, strip_spaces=self.strip_spaces)
+
+    def normalized(self, tests, first_index):
+        """
+        Yields the tests in their order, while up to lookahead next ones are being normalized
+        """
+        pending = deque()
+        for index, test in enumerate(tests):
+            pending.append(self.pool.submit(self.task, test, first_index + index))
+            if len(pending) >= self.lookahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self):
+        # normally nothing is queued by now, after a failure the tests normalized ahead are not needed
+        self.pool.shutdown(cancel_futures=True)
+        if self.directory is not None:
+            # the normalized tests are uploaded by now
+            scratch_space.remove_directory(self.directory)
+
+
+def test_normalizer(options, workers, wrap=None):
+    if 'normalize' not in options:
+        return None
+    return TestNormalizer(strip_spaces=options['normalize'] == 'spaces', workers=workers, wrap=wrap)
@@ -0,0 +1,527 @@
+import hashlib
+import threading
+import time
+from contextlib import nullcontext
+
+from polygon_api import (
+    FileType,
+    SolutionTag,
+    PolygonRequestFailedException,
+)
+
+from .authentication import authenticate
+from .credentials import pinned_client
+from .budget import byte_budget
+from .journal import Journal, JournaledProblem
+from .polygon import ImportAbortedException, upload_groups, with_retries, check_cancelled, worker_pool
+from .profiling import phase_profiler
+from .normalization import test_normalizer
+from .transaction import polygon_transaction, transaction_options
+
+UPLOAD_WORKERS = 8
+
+
+class FileItem:
+    __slots__ = ('path', 'content', 'name', 'file_types', 'source_type', 'resource_advanced_properties',
+                 'preprocess')
+
+    def __init__(self, path, content, name, file_types=(FileType.RESOURCE,), source_type=None,
+                 resource_advanced_properties=None, preprocess=None):
+        self.path = path
+        self.content = content
+        self.name = name
+        self.file_types = file_types
+        self.source_type = source_type
+        self.resource_advanced_properties = resource_advanced_properties
+        self.preprocess = preprocess
+
+
+class SolutionItem:
+    __slots__ = ('name', 'content', 'tag', 'source_types')
+
+    def __init__(self, name, content, tag, source_types=(None,)):
+        self.name = name
+        self.content = content
+        self.tag = tag
+        self.source_types = source_types
+
+
+class StatementItem:
+    __slots__ = ('lang', 'statement')
+
+    def __init__(self, lang, statement):
+        self.lang = lang
+        self.statement = statement
+
+
+class ResourceItem:
+    __slots__ = ('path', 'content', 'name')
+
+    def __init__(self, path, content, name):
+        self.path = path
+        self.content = content
+        self.name = name
+
+
+class ValidatorTestItem:
+    __slots__ = ('path', 'content', 'verdict')
+
+    def __init__(self, path, content, verdict):
+        self.path = path
+        self.content = content
+        self.verdict = verdict
+
+    def size(self):
+        return self.content.size()
+
+    def fingerprint(self):
+        return text_fingerprint(self.content())
+
+
+class CheckerTestItem:
+    __slots__ = ('path', 'input', 'output', 'answer', 'verdict')
+
+    def __init__(self, path, input, output, answer, verdict):
+        self.path = path
+        self.input = input
+        self.output = output
+        self.answer = answer
+        self.verdict = verdict
+
+    def size(self):
+        return self.input.size() + self.output.size() + self.answer.size()
+
+    def fingerprint(self):
+        return text_fingerprint(self.input(), self.output(), self.answer())
+
+
+def text_fingerprint(*texts):
+    # Polygon may return the texts with other line endings and without the final newline
+    digest = hashlib.sha256()
+    for text in texts:
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', errors='replace')
+        digest.update(text.replace('\r\n', '\n').rstrip('\n').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SourceAdapter:
+    """
+    Source of a problem for ImportPipeline.
+    Every method lazily yields (or returns) its part of the problem, a part that is not overridden is left as is.
+    """
+    name = 'import'
+
+    def prepare(self):
+        pass
+
+    def groups(self):
+        return []
+
+    def solutions(self):
+        return []
+
+    def statements(self):
+        return []
+
+    def statement_resources(self):
+        return []
+
+    def files(self):
+        return []
+
+    def checker(self):
+        return None
+
+    def validator(self):
+        return None
+
+    def validator_tests(self):
+        return []
+
+    def checker_tests(self):
+        return []
+
+    def cleanup(self):
+        """
+        Removes the scratch directories of the import, called when the import is over
+        """
+        pass
+
+    def info(self):
+        return None
+
+    def description(self):
+        return None
+
+    def tutorial(self):
+        return None
+
+    def tags(self):
+        return None
+
+    def commit_message(self):
+        return self.name
+
+
+class PhaseReport:
+    __slots__ = ('name', 'seconds', 'done', 'failed')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.done = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return "PhaseReport { name: %s, seconds: %.3f, done: %d, failed: %d }" % (self.name, self.seconds,
+                                                                                   self.done, self.failed)
+
+
+class ImportReport:
+    def __init__(self, source, polygon_pid):
+        self.source = source
+        self.polygon_pid = polygon_pid
+        self.problem_id = None
+        self.phases = []
+        self.errors = []
+        self.normalized = []
+        self.seconds = 0.0
+        # the exception that stopped the import, None if it ran to the end
+        self.exception = None
+
+    def succeeded(self):
+        return self.exception is None
+
+    def done(self):
+        return sum(phase.done for phase in self.phases)
+
+    def failed(self):
+        return sum(phase.failed for phase in self.phases)
+
+    def to_dict(self):
+        return {
+            'source': self.source,
+            'polygon_pid': self.polygon_pid,
+            'problem_id': self.problem_id,
+            'succeeded': self.succeeded(),
+            'seconds': self.seconds,
+            'done': self.done(),
+            'failed': self.failed(),
+            'phases': [{'name': phase.name, 'seconds': phase.seconds, 'done': phase.done, 'failed': phase.failed}
+                       for phase in self.phases],
+            'errors': list(self.errors),
+            'normalized': [{'test': test_index, 'description': description, 'fixes': fixes}
+                           for test_index, description, fixes in sorted(self.normalized)],
+        }
+
+    def phase(self, name):
+        phase = PhaseReport(name)
+        self.phases.append(phase)
+        return phase
+
+    def print_summary(self):
+        print("Import of %s into problem %s:" % (self.source, self.polygon_pid))
+        for phase in self.phases:
+            print("  %-16s %7.3f s, %d done, %d failed" % (phase.name, phase.seconds, phase.done, phase.failed))
+        for test_index, description, fixes in sorted(self.normalized):
+            print("  normalized test %d [%s]: %s" % (test_index, description, ", ".join(fixes)))
+        for error in self.errors:
+            print("  error: %s" % error)
+
+
+def find_problem(api, polygon_pid, create=False):
+    print("problems.list id = %s" % polygon_pid)
+    if polygon_pid.isdigit():
+        prob = list(api.problems_list(id=polygon_pid))
+    else:
+        prob = list(api.problems_list(name=polygon_pid))
+    if len(prob) == 0:
+        if create and not polygon_pid.isdigit():
+            print("problem.create name = %s" % polygon_pid)
+            return api.problem_create(name=polygon_pid)
+        raise ImportAbortedException("Problem %s not found" % polygon_pid)
+    return prob[0]
+
+
+def run_import(create_adapter, polygon_pid, client=None, options=None):
+    """
+    Runs the import of the adapter returned by create_adapter(), e.g. functools.partial(DomjudgeAdapter, ...),
+    into polygon_pid in this process and returns its ImportReport. Nothing is raised and the process is never
+    exited, not even when the source cannot be read or the import is interrupted: the exception that stopped
+    the import (also KeyboardInterrupt or SystemExit) is in report.exception and its message is the last of
+    report.errors.
+    client is an authenticated Polygon client, authenticate() is called if it is None.
+    options are the long options of the command line without the dashes, e.g. {'create': True, 'workers': 4}.
+    The process-wide settings (memory budget, scratch space, cassettes) are left to the caller.
+    """
+    options = dict(options or {})
+    # the adapter class, also behind functools.partial, names the source when the adapter cannot be created
+    report = ImportReport(getattr(getattr(create_adapter, 'func', create_adapter), 'name', SourceAdapter.name),
+                          str(polygon_pid))
+    start = time.perf_counter()
+    try:
+        adapter = create_adapter()
+        report.source = adapter.name
+        pipeline = ImportPipeline(client if client is not None else authenticate(), adapter, str(polygon_pid),
+                                  options)
+        report = pipeline.report
+        pipeline.run()
+    except (Exception, SystemExit, KeyboardInterrupt) as e:
+        report.exception = e
+        report.errors.append(e.comment if isinstance(e, ImportAbortedException) else repr(e))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+class ImportPipeline:
+    def __init__(self, api, adapter, polygon_pid, options):
+        self.api = pinned_client(api)
+        self.adapter = adapter
+        self.polygon_pid = polygon_pid
+        self.options = options
+        self.workers = int(options.get('workers', UPLOAD_WORKERS))
+        self.report = ImportReport(adapter.name, polygon_pid)
+        self.profiler = phase_profiler(options, str(polygon_pid))
+        self.prob = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        try:
+            return self.run_import()
+        finally:
+            if self.profiler is not None:
+                self.profiler.close()
+            self.adapter.cleanup()
+
+    def run_import(self):
+        self.run_phase('prepare', lambda phase: self.adapter.prepare())
+        prob = find_problem(self.api, self.polygon_pid, create='create' in self.options)
+        self.report.problem_id = prob.id
+        journal = Journal(prob.id, resume='resume' in self.options)
+        self.prob = JournaledProblem(prob, journal)
+        with polygon_transaction(self.prob, self.adapter.commit_message(), journal,
+                                 **transaction_options(self.options)):
+            self.call("problem.enablePoints", self.prob.enable_points, True)
+            self.call("problem.enableGroups", self.prob.enable_groups, 'tests', True)
+            self.run_phase('tests', self.upload_tests)
+            self.run_phase('solutions', self.upload_solutions)
+            self.run_phase('statements', self.upload_statements)
+            self.run_phase('files', self.upload_files)
+            self.run_phase('checker', self.upload_checker)
+            self.run_phase('validator', self.upload_validator)
+            self.run_phase('validator-tests', self.upload_validator_tests)
+            self.run_phase('checker-tests', self.upload_checker_tests)
+            self.run_phase('general', self.upload_general)
+        if self.profiler is not None:
+            self.profiler.print_summary()
+        return self.report
+
+    def run_phase(self, name, action):
+        phase = self.report.phase(name)
+        start = time.perf_counter()
+        try:
+            with self.profiler.phase(name) if self.profiler is not None else nullcontext():
+                action(phase)
+        finally:
+            phase.seconds = time.perf_counter() - start
+
+    def profiled(self, action):
+        return self.profiler.profiled(action) if self.profiler is not None else action
+
+    def call(self, message, method, *args, **kwargs):
+        print(message)
+        return with_retries(lambda: method(*args, **kwargs))
+
+    def item_done(self, phase):
+        with self.lock:
+            phase.done += 1
+
+    def item_failed(self, phase, comment):
+        with self.lock:
+            self.report.errors.append("%s: %s" % (phase.name, comment))
+            phase.failed += 1
+
+    def run_items(self, phase, items, upload):
+        """
+        Uploads the items concurrently, returns the number of the uploaded ones
+        """
+        def run_item(item):
+            check_cancelled()
+            try:
+                upload(item)
+            except PolygonRequestFailedException as e:
+                print("API Error: " + e.comment)
+                self.item_failed(phase, e.comment)
+                return False
+            self.item_done(phase)
+            return True
+
+        with worker_pool(self.workers) as pool:
+            futures = [pool.submit(self.profiled(run_item), item) for item in items]
+            return sum(future.result() for future in futures)
+
+    def upload_tests(self, phase):
+        groups = list(self.adapter.groups())
+        normalizer = test_normalizer(self.options, self.workers, wrap=self.profiled)
+        try:
+            upload_groups(self.prob, groups, self.workers, normalizer,
+                          on_saved=lambda: self.item_done(phase),
+                          on_failed=lambda comment: self.item_failed(phase, comment),
+                          wrap=self.profiled)
+        finally:
+            if normalizer is not None:
+                normalizer.shutdown()
+                self.report.normalized = normalizer.changed
+
+    def upload_solution(self, item):
+        with byte_budget.reserve(item.content.size()):
+            code = item.content()
+            error = None
+            for source_type in item.source_types:
+                try:
+                    self.call('problem.saveSolution name = %s, sourceType = %s' % (item.name, source_type),
+                              self.prob.save_solution, name=item.name, file=code, source_type=source_type,
+                              tag=item.tag)
+                    return
+                except PolygonRequestFailedException as e:
+                    print("API Error: " + e.comment)
+                    error = e
+            raise error
+
+    def upload_solutions(self, phase):
+        items = list(self.adapter.solutions())
+        if not any(item.tag == SolutionTag.MA for item in items):
+            # the main solution is the first accepted one that Polygon takes, the others are uploaded concurrently
+            for item in [item for item in items if item.tag == SolutionTag.OK]:
+                items.remove(item)
+                main = SolutionItem(item.name, item.content, SolutionTag.MA, item.source_types)
+                if self.run_items(phase, [main], self.upload_solution) > 0:
+                    break
+        self.run_items(phase, items, self.upload_solution)
+
+    def upload_statement(self, item):
+        self.call("problem.saveStatement language = " + item.lang,
+                  self.prob.save_statement, lang=item.lang, problem_statement=item.statement)
+
+    def upload_statement_resource(self, item):
+        with byte_budget.reserve(item.content.size()):
+            content = item.content()
+            self.call("problem.saveStatementResource %s, size = %d bytes" % (item.path, len(content)),
+                      self.prob.save_statement_resource, item.name, content)
+
+    def upload_statements(self, phase):
+        with worker_pool(2) as pool:
+            futures = [pool.submit(self.profiled(self.run_items), phase, self.adapter.statements(),
+                                   self.upload_statement),
+                       pool.submit(self.profiled(self.run_items), phase, self.adapter.statement_resources(),
+                                   self.upload_statement_resource)]
+            for future in futures:
+                future.result()
+
+    def upload_file(self, item):
+        with byte_budget.reserve(item.content.size()):
+            content = item.content()
+            if item.preprocess is not None:
+                content = item.preprocess(content)
+            error = None
+            for file_type in item.file_types:
+                try:
+                    self.call("problem.saveFile: %s   with name='%s', type = %s" % (item.path, item.name, file_type),
+                              self.prob.save_file, type=file_type, name=item.name, file=content,
+                              source_type=item.source_type,
+                              resource_advanced_properties=item.resource_advanced_properties)
+                    return
+                except PolygonRequestFailedException as e:
+                    print("API Error: " + e.comment)
+                    error = e
+            raise error
+
+    def upload_files(self, phase):
+        self.run_items(phase, self.adapter.files(), self.upload_file)
+
+    def set_source(self, phase, source, set_method, method_name):
+        if source is None:
+            return
+        if isinstance(source, FileItem):
+            try:
+                self.upload_file(source)
+            except PolygonRequestFailedException as e:
+                self.report.errors.append("%s: %s" % (phase.name, e.comment))
+                phase.failed += 1
+                return
+            source = source.name
+        self.call("%s %s" % (method_name, source), set_method, source)
+        phase.done += 1
+
+    def upload_checker(self, phase):
+        self.set_source(phase, self.adapter.checker(), self.prob.set_checker, "problem.setChecker")
+
+    def upload_validator(self, phase):
+        self.set_source(phase, self.adapter.validator(), self.prob.set_validator, "problem.setValidator")
+
+    def new_numbered_tests(self, existing, items):
+        seen = set(fingerprint for fingerprint, _ in existing)
+        index = max([index for _, index in existing], default=0) + 1
+        numbered = []
+        for item in items:
+            with byte_budget.reserve(item.size()):
+                fingerprint = item.fingerprint()
+            if fingerprint in seen:
+                print("%s is already there, skipped" % item.path)
+                continue
+            seen.add(fingerprint)
+            numbered.append((index, item))
+            index += 1
+        return numbered
+
+    def upload_validator_test(self, numbered):
+        index, item = numbered
+        with byte_budget.reserve(item.size()):
+            self.call("problem.saveValidatorTest %d: %s, verdict = %s" % (index, item.path, item.verdict),
+                      self.prob.save_validator_test, index, test_input=item.content(), test_verdict=item.verdict,
+                      check_existing=True)
+
+    def upload_validator_tests(self, phase):
+        items = list(self.adapter.validator_tests())
+        if len(items) == 0:
+            return
+        print("problem.validatorTests")
+        existing = [(text_fingerprint(t.input), t.index) for t in with_retries(self.prob.validator_tests)]
+        self.run_items(phase, self.new_numbered_tests(existing, items), self.upload_validator_test)
+
+    def upload_checker_test(self, numbered):
+        index, item = numbered
+        with byte_budget.reserve(item.size()):
+            self.call("problem.saveCheckerTest %d: %s, verdict = %s" % (index, item.path, item.verdict),
+                      self.prob.save_checker_test, index, test_input=item.input(), test_output=item.output(),
+                      test_answer=item.answer(), test_verdict=item.verdict, check_existing=True)
+
+    def upload_checker_tests(self, phase):
+        items = list(self.adapter.checker_tests())
+        if len(items) == 0:
+            return
+        print("problem.checkerTests")
+        existing = [(text_fingerprint(t.input, t.output, t.answer), t.index)
+                    for t in with_retries(self.prob.checker_tests)]
+        self.run_items(phase, self.new_numbered_tests(existing, items), self.upload_checker_test)
+
+    def upload_general(self, phase):
+        info = self.adapter.info()
+        if info is not None:
+            self.call("problem.updateInfo", self.prob.update_info, info)
+            phase.done += 1
+        description = self.adapter.description()
+        if description is not None:
+            self.call("problem.saveGeneralDescription: " + description,
+                      self.prob.save_general_description, description)
+            phase.done += 1
+        tutorial = self.adapter.tutorial()
+        if tutorial is not None:
+            self.call("problem.saveGeneralTutorial: " + tutorial, self.prob.save_general_tutorial, tutorial=tutorial)
+            phase.done += 1
+        tags = self.adapter.tags()
+        if tags is not None:
+            self.call("problem.saveTags: " + str(tags), self.prob.save_tags, tags)
+            phase.done += 1
@@ -1,9 +1,32 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
+
+import requests
 from polygon_api import (
     PointsPolicy,
     FeedbackPolicy,
+    HTTPRequestFailedException,
     PolygonRequestFailedException,
 )
+from .budget import byte_budget
+
+RETRIES = 3
+ALREADY_EXISTS_COMMENT = re.compile(r'already exists', re.IGNORECASE)
+# set when the process is asked to stop, the workers stop taking new tests and items
+import_cancelled = threading.Event()
+
+
+class ImportAbortedException(Exception):
+    """Exception raised by a source adapter when the import cannot go on"""
+
+    def __init__(self, comment):
+        super().__init__(comment)
+        self.comment = comment
 
 
 class GroupScoring(Enum):
@@ -12,6 +35,8 @@ class GroupScoring(Enum):
 
 
 class FileContents:
+    __slots__ = ('path',)
+
     def __init__(self, path):
         self.path = path
 
@@ -19,19 +44,38 @@ class FileContents:
         with open(self.path, 'r') as tf:
             return tf.read()
 
+    def size(self):
+        return os.path.getsize(self.path)
+
     def __repr__(self):
         return "FileTest { path: %s, description: %s }" % self.path
 
 
+class BinaryFileContents(FileContents):
+    __slots__ = ()
+
+    def __call__(self, *args, **kwargs):
+        with open(self.path, 'rb') as tf:
+            return tf.read()
+
+
 class MemoryContents:
+    __slots__ = ('content',)
+
     def __init__(self, content):
         self.content = content
 
     def __call__(self, *args, **kwargs):
         return self.content
 
+    def size(self):
+        return len(self.content)
+
 
 class Test:
+    __slots__ = ('content', 'description', 'use_in_statements', 'input_for_statements', 'output_for_statements',
+                 'verify')
+
     def __init__(self, content, description, use_in_statements=False, input_for_statements=None,
                  output_for_statements=None, verify=None):
         self.content = content
@@ -44,53 +88,184 @@ class Test:
     def __call__(self, *args, **kwargs):
         return self.content()
 
+    def size(self):
+        return self.content.size() if hasattr(self.content, 'size') else 0
+
+
+class TestTable:
+    """
+    Array-backed list of file tests: only the paths are stored, Test objects are created on access.
+    A test taken by index is kept, so that changes made to it are not lost.
+    """
+    __slots__ = ('paths', 'describe', 'use_in_statements', 'overrides')
+
+    def __init__(self, paths, describe, use_in_statements=False):
+        self.paths = paths
+        self.describe = describe
+        self.use_in_statements = use_in_statements
+        self.overrides = {}
+
+    def _make_test(self, index):
+        path = self.paths[index]
+        return Test(FileContents(path), self.describe(path), use_in_statements=self.use_in_statements)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.paths)
+        if index not in self.overrides:
+            self.overrides[index] = self._make_test(index)
+        return self.overrides[index]
+
+    def __iter__(self):
+        for index in range(len(self.paths)):
+            test = self.overrides.get(index)
+            yield test if test is not None else self._make_test(index)
+
+    def __repr__(self):
+        return "TestTable { tests: %d }" % len(self.paths)
+
 
 class Group:
-    def __init__(self, score, tests, scoring):
-        cnt = len(tests)
+    __slots__ = ('score', 'tests', 'scoring', 'count')
+
+    def __init__(self, score, tests, scoring, count=None):
+        if count is None:
+            if not hasattr(tests, '__len__'):
+                tests = list(tests)
+            count = len(tests)
         self.score = score
-        if cnt == 0:
-            self.points = []
-        elif scoring == GroupScoring.SUM:
-            self.points = [score // cnt] * (cnt - score % cnt) + [score // cnt + 1] * (score % cnt)
-        else:
-            self.points = [score] + [0] * (cnt - 1)
         self.tests = tests
         self.scoring = scoring
+        self.count = count
+
+    def point(self, index):
+        if self.scoring == GroupScoring.SUM and not isinstance(self.score, int):
+            # a fractional score is split evenly, Polygon takes fractional test points
+            return self.score / self.count
+        if self.scoring == GroupScoring.SUM:
+            return self.score // self.count + (1 if index >= self.count - self.score % self.count else 0)
+        return self.score if index == 0 else 0
+
+    @property
+    def points(self):
+        return map(self.point, range(self.count))
 
     def __repr__(self):
-        return "Group { score: %d, tests: %s, scoring: %s }" % (self.score, str(self.tests), str(self.scoring))
+        return "Group { score: %s, tests: %s, scoring: %s }" % (self.score, str(self.tests), str(self.scoring))
 
 
-def upload_groups(prob, groups):
-    test_index = 0
-    for gid, g in enumerate(groups):
-        if len(g.tests) == 0:
-            continue
-        for t, cur_score in zip(g.tests, g.points):
+def check_cancelled():
+    if import_cancelled.is_set():
+        raise ImportAbortedException("Import cancelled")
+
+
+@contextmanager
+def worker_pool(workers):
+    """
+    A thread pool that drops the queued work when the block is left with an exception, e.g. on a signal,
+    and only waits for the running work
+    """
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        yield pool
+    except BaseException:
+        pool.shutdown(cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def with_retries(action, attempts=RETRIES, first_delay=1):
+    delay = first_delay
+    for attempt in range(1, attempts + 1):
+        try:
+            return action()
+        except (HTTPRequestFailedException, requests.RequestException) as e:
+            if attempt == attempts:
+                raise
+            print("Request failed (%s), retrying in %d s" % (getattr(e, 'comment', e), delay))
+            time.sleep(delay)
+            delay *= 2
+
+
+def save_new_test(prob, test_index, test_contents, **kwargs):
+    """
+    Saves a new test. A test that is already there with the same input was saved by an earlier attempt whose response
+    or journal record was lost, so its properties are saved over it instead of failing the test.
+    """
+    try:
+        with_retries(lambda: prob.save_test('tests', test_index, test_contents, check_existing=True, **kwargs))
+    except PolygonRequestFailedException as exc:
+        if ALREADY_EXISTS_COMMENT.search(exc.comment or '') is None:
+            raise
+        existing = with_retries(lambda: prob.test_input('tests', test_index, binary=True))
+        expected = test_contents.encode('utf-8') if isinstance(test_contents, str) else test_contents
+        if existing != expected:
+            raise
+        print("problem.saveTest %d is already saved with the same input, updating it" % test_index)
+        with_retries(lambda: prob.save_test('tests', test_index, test_contents, check_existing=False, **kwargs))
+
+
+def upload_group(prob, gid, g, first_index, normalizer=None, on_saved=None, on_failed=None):
+    """
+    Uploads the tests of a group and sets its policies. on_saved() is called for every saved test,
+    on_failed(comment) for every test or group that Polygon rejects.
+    """
+    def failed(comment):
+        print("API Error: " + comment)
+        if on_failed is not None:
+            on_failed(comment)
+
+    tests = g.tests if normalizer is None else normalizer.normalized(g.tests, first_index)
+    for index, t in enumerate(tests):
+        check_cancelled()
+        test_index = first_index + index
+        cur_score = g.point(index)
+        with byte_budget.reserve(t.size()):
             test_contents = t()
-            test_index += 1
             print("problem.saveTest %d [%s] with group %d and score %s"
                   % (test_index, t.description, gid, str(cur_score)))
             try:
-                prob.save_test('tests', test_index, test_contents,
-                               test_group=gid,
-                               test_points=cur_score,
-                               test_description=t.description,
-                               check_existing=True,
-                               test_use_in_statements=t.use_in_statements,
-                               test_input_for_statements=t.input_for_statements,
-                               test_output_for_statements=t.output_for_statements,
-                               verify_input_output_for_statements=t.verify)
+                save_new_test(prob, test_index, test_contents,
+                              test_group=gid,
+                              test_points=cur_score,
+                              test_description=t.description,
+                              test_use_in_statements=t.use_in_statements,
+                              test_input_for_statements=t.input_for_statements,
+                              test_output_for_statements=t.output_for_statements,
+                              verify_input_output_for_statements=t.verify)
             except PolygonRequestFailedException as exc:
-                print(exc.comment, "skipped")
-        if g.scoring == GroupScoring.SUM:
-            print("problem.saveTestGroup group %d, pointsPolicy=EACH_TEST, feedbackPolicy=COMPLETE" % gid)
-            prob.save_test_group('tests', gid,
-                                 points_policy=PointsPolicy.EACH_TEST,
-                                 feedback_policy=FeedbackPolicy.COMPLETE)
-        else:
-            print("problem.saveTestGroup group %d, pointsPolicy=COMPLETE_GROUP, feedbackPolicy=ICPC" % gid)
-            prob.save_test_group('tests', gid,
-                                 points_policy=PointsPolicy.COMPLETE_GROUP,
-                                 feedback_policy=FeedbackPolicy.ICPC)
+                failed("test %d [%s]: %s" % (test_index, t.description, exc.comment))
+                continue
+        if on_saved is not None:
+            on_saved()
+    if g.scoring == GroupScoring.SUM:
+        print("problem.saveTestGroup group %d, pointsPolicy=EACH_TEST, feedbackPolicy=COMPLETE" % gid)
+        policies = {'points_policy': PointsPolicy.EACH_TEST, 'feedback_policy': FeedbackPolicy.COMPLETE}
+    else:
+        print("problem.saveTestGroup group %d, pointsPolicy=COMPLETE_GROUP, feedbackPolicy=ICPC" % gid)
+        policies = {'points_policy': PointsPolicy.COMPLETE_GROUP, 'feedback_policy': FeedbackPolicy.ICPC}
+    try:
+        with_retries(lambda: prob.save_test_group('tests', gid, **policies))
+    except PolygonRequestFailedException as exc:
+        failed("group %d: %s" % (gid, exc.comment))
+
+
+def upload_groups(prob, groups, workers=1, normalizer=None, on_saved=None, on_failed=None, wrap=None):
+    # wrap(task) is applied to the upload of every group, e.g. to profile it in its thread
+    # test indices are assigned upfront, so that every group is an independent unit of work
+    units = []
+    first_index = 1
+    for gid, g in enumerate(groups):
+        if g.count == 0:
+            continue
+        units.append((gid, g, first_index))
+        first_index += g.count
+    task = upload_group if wrap is None else wrap(upload_group)
+    with worker_pool(workers) as pool:
+        futures = [pool.submit(task, prob, gid, g, first, normalizer, on_saved, on_failed)
+                   for gid, g, first in units]
+        for future in futures:
+            future.result()
@@ -0,0 +1,165 @@
+import cProfile
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+DEFAULT_PROFILE_DIRECTORY = 'profile'
+HOTTEST_FUNCTIONS = 5
+TOP_ALLOCATIONS = 25
+
+# tracemalloc is shared by the profilers of concurrent imports, the last one to close stops it
+tracing_lock = threading.Lock()
+tracing_users = 0
+tracing_started = False
+
+
+def start_tracing():
+    global tracing_users, tracing_started
+    with tracing_lock:
+        if tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            tracing_started = True
+        tracing_users += 1
+
+
+def stop_tracing():
+    global tracing_users, tracing_started
+    with tracing_lock:
+        tracing_users -= 1
+        if tracing_users == 0 and tracing_started:
+            # tracing that was on before the first profiler is left on
+            tracemalloc.stop()
+            tracing_started = False
+
+
+class PhaseSummary:
+    __slots__ = ('name', 'seconds', 'peak', 'hottest')
+
+    def __init__(self, name, seconds, peak, hottest):
+        self.name = name
+        self.seconds = seconds
+        self.peak = peak
+        self.hottest = hottest
+
+
+class PhaseProfiler:
+    """
+    Profiles every import phase with cProfile and tracemalloc, and with pyinstrument when it is installed.
+    Work done in upload threads is profiled through profiled() and merged into the profile of its phase.
+    Memory peaks are process-wide: with concurrent imports a phase peak includes the memory of the other imports.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.thread_profiles = []
+        self.summaries = []
+        self.tracing = False
+
+    def profiled(self, action):
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is already active in this interpreter, run the action unprofiled
+                return action(*args, **kwargs)
+            try:
+                return action(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.thread_profiles.append(profile)
+        return run
+
+    @contextmanager
+    def phase(self, name):
+        prefix = os.path.join(self.directory, "%02d-%s" % (len(self.summaries) + 1, name))
+        if not self.tracing:
+            start_tracing()
+            self.tracing = True
+        tracemalloc.reset_peak()
+        sampler = pyinstrument.Profiler() if pyinstrument is not None else None
+        if sampler is not None:
+            sampler.start()
+        with self.lock:
+            self.thread_profiles = []
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is already active in this interpreter, e.g. of a concurrent import on Python 3.12+,
+            # the phase still gets its thread profiles, timing and memory
+            profile = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            seconds = time.perf_counter() - start
+            if sampler is not None:
+                sampler.stop()
+                with open(prefix + ".sampled.txt", "w") as f:
+                    f.write(sampler.output_text(unicode=False, color=False))
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            with self.lock:
+                profiles = self.thread_profiles
+                self.thread_profiles = []
+            stats = pstats.Stats()
+            for phase_profile in ([profile] if profile is not None else []) + profiles:
+                try:
+                    stats.add(phase_profile)
+                except TypeError:
+                    # pstats refuses a profile that recorded no calls
+                    pass
+            stats.dump_stats(prefix + ".prof")
+            self.write_allocations(prefix + ".alloc.txt", snapshot, peak)
+            self.summaries.append(PhaseSummary(name, seconds, peak, hottest_functions(stats)))
+
+    def write_allocations(self, path, snapshot, peak):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        with open(path, "w") as f:
+            f.write("Peak traced memory: %d bytes\n" % peak)
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write("%s\n" % stat)
+
+    def close(self):
+        if self.tracing:
+            stop_tracing()
+            self.tracing = False
+
+    def print_summary(self):
+        print("Profiles are written to %s" % os.path.abspath(self.directory))
+        for summary in self.summaries:
+            print("  %-16s %7.3f s, process peak memory %.1f MB" % (summary.name, summary.seconds,
+                                                                   summary.peak / 2 ** 20))
+            for function, seconds, calls in summary.hottest:
+                print("      %7.3f s %8d calls  %s" % (seconds, calls, function))
+
+
+def hottest_functions(stats, count=HOTTEST_FUNCTIONS):
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    return [("%s:%d(%s)" % (os.path.basename(filename), line, name), total_time, calls)
+            for (filename, line, name), (_, calls, total_time, _, _) in functions]
+
+
+def phase_profiler(options, name):
+    if 'profile' not in options:
+        return None
+    directory = options['profile'] if options['profile'] is not True else DEFAULT_PROFILE_DIRECTORY
+    return PhaseProfiler(os.path.join(directory, name))
@@ -0,0 +1,122 @@
+import fnmatch
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+
+from .polygon import BinaryFileContents, worker_pool
+
+RESOURCE_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'polygon_uploader', 'resources')
+BUILD_ARTEFACTS = ['*.aux', '*.log', '*.out', '*.toc', '*.fls', '*.fdb_latexmk', '*.synctex.gz', '*.bbl', '*.blg',
+                   '*.nav', '*.snm', '*.vrb', '*~']
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# text and time chunks do not affect how the image looks
+PNG_METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+
+def is_build_artefact(path):
+    if any(fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in BUILD_ARTEFACTS):
+        return True
+    # a PDF next to the LaTeX source of the same name is its compiled output
+    stem, extension = os.path.splitext(path)
+    return extension.lower() == '.pdf' and os.path.isfile(stem + '.tex')
+
+
+def recompress_png(data):
+    """
+    Recompresses the pixel data of a PNG with the best zlib settings into a single IDAT chunk,
+    dropping the text and time chunks. The pixels are not changed.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    chunks = []
+    image_data = []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        position += length + 12
+        if kind == b'IDAT':
+            if len(image_data) == 0:
+                chunks.append((kind, None))
+            image_data.append(body)
+        elif kind not in PNG_METADATA_CHUNKS:
+            chunks.append((kind, body))
+    try:
+        pixels = zlib.decompress(b''.join(image_data))
+    except zlib.error:
+        return None
+    packed = None
+    for strategy in [zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED]:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+        candidate = compressor.compress(pixels) + compressor.flush()
+        if packed is None or len(candidate) < len(packed):
+            packed = candidate
+    result = [PNG_SIGNATURE]
+    for kind, body in chunks:
+        if body is None:
+            body = packed
+        result.append(struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body)))
+    return b''.join(result)
+
+
+def optimize_jpeg(path):
+    jpegtran = shutil.which('jpegtran')
+    if jpegtran is None:
+        return None
+    # only the Huffman tables are optimized, all markers including EXIF orientation are kept
+    result = subprocess.run([jpegtran, '-copy', 'all', '-optimize', path], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    return result.stdout if result.returncode == 0 else None
+
+
+def optimize_image(path, data):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        return recompress_png(data)
+    if extension in ['.jpg', '.jpeg']:
+        return optimize_jpeg(path)
+    return None
+
+
+class ResourceOptimizer:
+    """
+    Losslessly recompresses images in a thread pool, the results are cached by the hash of the original contents
+    """
+
+    def __init__(self, cache_directory=RESOURCE_CACHE_DIRECTORY, workers=None):
+        self.cache_directory = cache_directory
+        self.workers = workers or os.cpu_count() or 1
+        os.makedirs(cache_directory, exist_ok=True)
+
+    def optimize_file(self, path):
+        if os.path.splitext(path)[1].lower() not in ['.png', '.jpg', '.jpeg']:
+            return BinaryFileContents(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        cached = os.path.join(self.cache_directory, hashlib.sha256(data).hexdigest())
+        if os.path.isfile(cached):
+            return BinaryFileContents(cached)
+        if os.path.isfile(cached + '.keep'):
+            return BinaryFileContents(path)
+        optimized = optimize_image(path, data)
+        if optimized is None or len(optimized) >= len(data):
+            open(cached + '.keep', 'w').close()
+            return BinaryFileContents(path)
+        # concurrent imports may optimize the same image, each writes its own file and the last rename wins
+        with tempfile.NamedTemporaryFile(dir=self.cache_directory, suffix='.part', delete=False) as f:
+            f.write(optimized)
+        os.replace(f.name, cached)
+        print("%s: %d -> %d bytes" % (path, len(data), len(optimized)))
+        return BinaryFileContents(cached)
+
+    def optimize_all(self, paths):
+        with worker_pool(self.workers) as pool:
+            contents = list(pool.map(self.optimize_file, paths))
+        before = sum(os.path.getsize(path) for path in paths)
+        after = sum(content.size() for content in contents)
+        print("Statement resources: %d files, %d -> %d bytes" % (len(paths), before, after))
+        return contents
@@ -1,15 +1,156 @@
+import os
 import tempfile
 import shutil
 import atexit
+import signal
+import threading
 
+from .cli import size_option
+from .polygon import ImportAbortedException, import_cancelled
 
-def create_temporary_directory(prefix):
-    directory = tempfile.mkdtemp(prefix=prefix)
+FAST_SCRATCH_DIRECTORY = '/dev/shm'
+# share of the free tmpfs space a single directory may take when --fast-scratch-limit is not given
+FAST_SCRATCH_SHARE = 0.5
+
+
+class ScratchSpaceExceededException(ImportAbortedException):
+    pass
+
+
+class ScratchSpace:
+    """
+    Temporary directories of an import: small data goes to tmpfs, large data to disk.
+    Everything is removed at exit, and on SIGTERM and SIGINT once install_handlers() is called.
+    """
+
+    def __init__(self, directory=None, fast_directory=FAST_SCRATCH_DIRECTORY, fast_limit=None, quota=None):
+        self.directory = directory
+        self.fast_directory = fast_directory
+        self.fast_limit = fast_limit
+        self.quota = quota
+        self.used = 0
+        self.directories = []
+        self.lock = threading.Lock()
+        self.cleanup_registered = False
+        self.handlers_installed = False
+        self.interrupted = False
+
+    def configure(self, options):
+        if 'scratch-dir' in options:
+            self.directory = options['scratch-dir']
+        if 'fast-scratch-dir' in options:
+            # an empty --fast-scratch-dir= keeps everything on disk
+            self.fast_directory = options['fast-scratch-dir'] or None
+        if 'fast-scratch-limit' in options:
+            self.fast_limit = size_option(options, 'fast-scratch-limit')
+        if 'scratch-quota' in options:
+            self.quota = size_option(options, 'scratch-quota')
+
+    def choose_root(self, size):
+        if size is None or self.fast_directory is None or not os.access(self.fast_directory, os.W_OK):
+            return self.directory
+        limit = self.fast_limit
+        if limit is None:
+            limit = int(shutil.disk_usage(self.fast_directory).free * FAST_SCRATCH_SHARE)
+        return self.fast_directory if size <= limit else self.directory
+
+    def charge(self, size):
+        with self.lock:
+            if self.quota is not None and self.used + size > self.quota:
+                raise ScratchSpaceExceededException("Scratch space quota exceeded: %d bytes are used, %d more are "
+                                                    "needed, the quota is %d bytes" % (self.used, size, self.quota))
+            self.used += size
+
+    def create_directory(self, prefix, size=None):
+        """
+        Creates a directory for about size bytes of data, the size is charged against the quota.
+        When the size is not known, the directory is created on disk.
+        """
+        self.register_cleanup()
+        root = self.choose_root(size)
+        if size is not None:
+            self.charge(size)
+        directory = tempfile.mkdtemp(prefix=prefix, dir=root)
+        with self.lock:
+            self.directories.append(directory)
+        print("Scratch directory %s created for %s" % (directory, "unknown size" if size is None else
+                                                       "%d bytes" % size))
+        return directory
+
+    def extract(self, zip_archive, members, prefix):
+        size = sum(zip_archive.getinfo(name).file_size for name in members)
+        directory = self.create_directory(prefix, size)
+        zip_archive.extractall(path=directory, members=members)
+        return directory
 
-    def cleaner(dir_to_remove):
-        def do_cleaner():
-            shutil.rmtree(dir_to_remove)
-        return do_cleaner
+    def remove_directory(self, directory):
+        """
+        Removes a directory before the exit, the size of its contents is returned to the quota
+        """
+        with self.lock:
+            if directory not in self.directories:
+                return
+            self.directories.remove(directory)
+        size = directory_size(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+        with self.lock:
+            self.used = max(0, self.used - size)
 
-    atexit.register(cleaner(directory))
-    return directory
+    def cleanup(self):
+        with self.lock:
+            directories = self.directories
+            self.directories = []
+        for directory in directories:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def register_cleanup(self):
+        with self.lock:
+            if self.cleanup_registered:
+                return
+            self.cleanup_registered = True
+        atexit.register(self.cleanup)
+
+    def install_handlers(self):
+        """
+        Makes SIGTERM and SIGINT stop the import and remove the directories, called by the command line tools
+        from the main thread. Library users keep their own signal handling.
+        """
+        self.register_cleanup()
+        if self.handlers_installed:
+            return
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, self.handle_signal)
+        self.handlers_installed = True
+
+    def handle_signal(self, signum, frame):
+        if self.interrupted:
+            # the second signal does not wait for the import to unwind
+            self.cleanup()
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        self.interrupted = True
+        print("Interrupted by signal %d, cleaning up" % signum)
+        # the workers stop after their current request and the queued work is dropped,
+        # unwinding lets the import keep its working copy for --resume, the directories are removed at exit
+        import_cancelled.set()
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        raise SystemExit(128 + signum)
+
+
+def directory_size(directory):
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                size += os.path.getsize(path)
+    return size
+
+
+scratch_space = ScratchSpace()
+
+
+def create_temporary_directory(prefix):
+    return scratch_space.create_directory(prefix)
@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+
+import requests
+from polygon_api import (
+    PackageState,
+    HTTPRequestFailedException,
+    PolygonRequestFailedException,
+)
+
+# failures after which the import can be continued with --resume, the working copy is kept for it
+RESUMABLE_EXCEPTIONS = (KeyboardInterrupt, SystemExit, HTTPRequestFailedException, requests.RequestException)
+
+
+def wait_for_package(prob, previous_ids=(), first_delay=2, max_delay=60, timeout=3600):
+    """
+    Waits for a package that is not one of previous_ids to be built
+    """
+    delay = first_delay
+    deadline = time.monotonic() + timeout
+    while True:
+        packages = [p for p in prob.packages() if p.id not in previous_ids]
+        if len(packages) > 0:
+            package = max(packages, key=lambda p: p.id)
+            if package.state in [PackageState.READY, PackageState.FAILED]:
+                print("Package %s for revision %s: %s %s" % (package.id, package.revision, package.state,
+                                                              package.comment or ""))
+                return package
+        if time.monotonic() + delay > deadline:
+            print("Package is still not built after %d seconds, stopped waiting" % timeout)
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def build_package(prob, full=False, verify=True):
+    previous_ids = set(p.id for p in prob.packages())
+    print("problem.buildPackage full = %s, verify = %s" % (full, verify))
+    prob.build_package(full=full, verify=verify)
+    return wait_for_package(prob, previous_ids)
+
+
+@contextmanager
+def polygon_transaction(prob, message, journal=None, commit=True, discard_on_failure=True, package=None):
+    if not commit:
+        yield prob
+        return
+    dirty = bool(prob.modified)
+    if dirty:
+        print("Warning: problem %s already has uncommitted changes, they will be committed together with the import"
+              % prob.id)
+    try:
+        yield prob
+    except BaseException as e:
+        if dirty or not discard_on_failure:
+            print("Import failed, the working copy of problem %s is left as is" % prob.id)
+        elif isinstance(e, RESUMABLE_EXCEPTIONS):
+            print("Import interrupted, the working copy of problem %s is kept, rerun with --resume to continue"
+                  % prob.id)
+        else:
+            print("Import failed, problem.discardWorkingCopy")
+            try:
+                prob.discard_working_copy()
+                if journal is not None:
+                    journal.reset()
+            except PolygonRequestFailedException as e:
+                print("API Error: " + e.comment)
+        raise
+    print("problem.commitChanges message = %s" % message)
+    prob.commit_changes(minor_changes=False, message=message)
+    if journal is not None:
+        journal.clear()
+    if package is not None:
+        build_package(prob, full=package == 'full')
+
+
+def transaction_options(options):
+    return {
+        'commit': 'no-commit' not in options,
+        # a resumed import continues the kept working copy, discarding it would throw away the earlier runs too
+        'discard_on_failure': 'no-discard' not in options and 'resume' not in options,
+        'package': None if 'build-package' not in options else options['build-package'],
+    }
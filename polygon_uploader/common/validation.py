@@ -0,0 +1,121 @@
+import glob
+import os
+import requests
+import shutil
+import subprocess
+import time
+
+from .file_download import download_file_to
+from .polygon import worker_pool
+
+TESTLIB_VERSION = '0.9.41'
+TESTLIB_URL = 'https://raw.githubusercontent.com/MikeMirzayanov/testlib/%s/testlib.h' % TESTLIB_VERSION
+TESTLIB_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'polygon_uploader', 'testlib', TESTLIB_VERSION,
+                             'testlib.h')
+# testlib validators exit with 0, DOMjudge validators exit with 42 on a valid input
+ACCEPTED_EXIT_CODES = (0, 42)
+
+
+class ValidationResult:
+    def __init__(self, path, valid, seconds, size, message):
+        self.path = path
+        self.valid = valid
+        self.seconds = seconds
+        self.size = size
+        self.message = message
+
+    def __repr__(self):
+        return "ValidationResult { path: %s, valid: %s, seconds: %.3f }" % (self.path, self.valid, self.seconds)
+
+
+def find_testlib(directory, testlib=None):
+    """
+    Returns testlib.h for the validators: the given one, the one shipped with the package,
+    or a cached copy of the pinned version, None if there is none
+    """
+    if testlib is not None:
+        return testlib
+    packaged = sorted(glob.glob(os.path.join(directory, '**', 'testlib.h'), recursive=True))
+    if len(packaged) > 0:
+        return packaged[0]
+    if not os.path.isfile(TESTLIB_CACHE):
+        os.makedirs(os.path.dirname(TESTLIB_CACHE), exist_ok=True)
+        partial = '%s.%d.part' % (TESTLIB_CACHE, os.getpid())
+        try:
+            downloaded = download_file_to(TESTLIB_URL, partial)
+        except requests.RequestException as e:
+            print("Error: " + str(e))
+            downloaded = False
+        if not downloaded:
+            if os.path.exists(partial):
+                os.remove(partial)
+            return None
+        os.replace(partial, TESTLIB_CACHE)
+    return TESTLIB_CACHE
+
+
+def uses_testlib(sources):
+    for source in sources:
+        with open(source, errors='replace') as fs:
+            if 'testlib.h' in fs.read():
+                return True
+    return False
+
+
+def compile_validator(sources, work_dir, name='validator', testlib=None):
+    compiler = shutil.which('g++')
+    if compiler is None:
+        print("Warning: g++ not found, local validation is skipped")
+        return None
+    include_dirs = []
+    for source in sources:
+        include_dir = os.path.dirname(os.path.abspath(source))
+        if include_dir not in include_dirs:
+            include_dirs.append(include_dir)
+    if uses_testlib(sources) and not any(os.path.isfile(os.path.join(d, 'testlib.h')) for d in include_dirs):
+        if testlib is None:
+            print("Warning: testlib.h is not available, local validation is skipped")
+            return None
+        include_dirs.append(os.path.dirname(os.path.abspath(testlib)))
+    binary = os.path.join(work_dir, name)
+    print("Compiling validator %s" % ", ".join(sources))
+    command = [compiler, '-O2', '-std=c++17']
+    for include_dir in include_dirs:
+        command += ['-I', include_dir]
+    result = subprocess.run(command + ['-o', binary] + list(sources),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode != 0:
+        print("Warning: validator compilation failed, local validation is skipped")
+        print(result.stdout)
+        return None
+    return binary
+
+
+def validate_test(binary, path, flags=()):
+    start = time.perf_counter()
+    with open(path, 'rb') as fs:
+        result = subprocess.run([binary] + list(flags), stdin=fs, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    message = (result.stderr or result.stdout).decode('utf-8', errors='replace').strip()
+    return ValidationResult(path, result.returncode in ACCEPTED_EXIT_CODES, seconds, os.path.getsize(path), message)
+
+
+def validate_tests(binary, files, flags=None, workers=None):
+    """
+    Runs the validator over the files in parallel, flags maps a file to the command line arguments for it
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    flags = flags or {}
+    start = time.perf_counter()
+    with worker_pool(workers) as pool:
+        results = list(pool.map(lambda path: validate_test(binary, path, flags.get(path, ())), files))
+    elapsed = time.perf_counter() - start
+    for r in results:
+        print("validate %s: %s (%.3f s)%s" % (r.path, "OK" if r.valid else "INVALID", r.seconds,
+                                              "" if r.valid or not r.message else ", " + r.message))
+    total_size = sum(r.size for r in results)
+    if elapsed > 0:
+        print("Validated %d tests (%d bytes) in %.3f s with %d workers: %.1f tests/s, %.1f MB/s"
+              % (len(results), total_size, elapsed, workers, len(results) / elapsed, total_size / elapsed / 2 ** 20))
+    return results
@@ -0,0 +1,2 @@
+from .domjudge import main, import_domjudge
+from .export import main as export_main
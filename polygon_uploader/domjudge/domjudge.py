@@ -1,3 +1,4 @@
+import functools
 import io
 import zipfile
 
@@ -6,7 +7,8 @@ from polygon_api import (
     Statement,
     FileType,
     ProblemInfo,
-    PolygonRequestFailedException,
+    ValidatorTestVerdict,
+    CheckerTestVerdict,
 )
 import sys
 import os
@@ -17,144 +19,412 @@ from ..common import *
 from .. import __version__
 
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: domjudgeimport <problem_directory> <polygon problem id> [--create]")
-        print("Example: domjudgeimport bapc2022/adjustedaverage 123123")
-        print("Version: " + __version__)
-        exit(239)
+LANGUAGES = {
+    'en': 'english',
+    'ru': 'russian',
+    'uk': 'ukrainian',
+    'be': 'belarusian',
+    'kk': 'kazakh',
+    'uz': 'uzbek',
+    'az': 'azerbaijani',
+    'hy': 'armenian',
+    'ka': 'georgian',
+    'de': 'german',
+    'fr': 'french',
+    'es': 'spanish',
+    'pt': 'portuguese',
+    'it': 'italian',
+    'nl': 'dutch',
+    'sv': 'swedish',
+    'no': 'norwegian',
+    'nb': 'norwegian',
+    'da': 'danish',
+    'fi': 'finnish',
+    'is': 'icelandic',
+    'pl': 'polish',
+    'cs': 'czech',
+    'sk': 'slovak',
+    'hu': 'hungarian',
+    'ro': 'romanian',
+    'bg': 'bulgarian',
+    'sr': 'serbian',
+    'hr': 'croatian',
+    'sl': 'slovenian',
+    'lt': 'lithuanian',
+    'lv': 'latvian',
+    'et': 'estonian',
+    'el': 'greek',
+    'tr': 'turkish',
+    'ar': 'arabic',
+    'he': 'hebrew',
+    'fa': 'persian',
+    'hi': 'hindi',
+    'bn': 'bengali',
+    'th': 'thai',
+    'vi': 'vietnamese',
+    'id': 'indonesian',
+    'zh': 'chinese',
+    'ja': 'japanese',
+    'ko': 'korean',
+    'mn': 'mongolian',
+}
+
+INVALID_INPUT_DIRECTORIES = ["invalid_inputs", "invalid_input"]
+VALIDATOR_DIRECTORIES = ["input_validators", "input_format_validators"]
+# testdata.yaml keys that make a package scored by groups, other keys (e.g. output_validator_flags) do not
+SCORING_KEYS = {'accept_score', 'reject_score', 'range', 'grader_flags', 'scoring', 'aggregation'}
+CPP_EXTENSIONS = ['.cpp', '.cc', '.cxx']
+# bytes of the local and central headers, the data descriptor and the zip64 extra fields of an entry, besides its name
+ZIP_ENTRY_OVERHEAD = 30 + 46 + 24 + 20 + 28
+# bytes of the end of central directory records, including the zip64 ones
+ZIP_END_OVERHEAD = 22 + 56 + 20
+WRONG_OUTPUT_DIRECTORIES = ["wrong_answer", "invalid_outputs", "invalid_output"]
+
+
+def find_language_files(directory, prefix):
+    pattern = re.compile(r"^%s[a-z]*(?:[._-]([a-z]{2,3}))?\.tex$" % prefix)
+    files = {}
+    for file in sorted(glob.glob(os.path.join(directory, "problem_statement", "*.tex"))):
+        match = pattern.match(os.path.basename(file))
+        if match is None:
+            continue
+        lang = match.group(1)
+        if lang is None:
+            files.setdefault('english', file)
+        elif lang in LANGUAGES:
+            files[LANGUAGES[lang]] = file
+        else:
+            print("Warning: unknown statement language '%s' in %s, skipped" % (lang, file))
+    return files
+
+
+def parse_statement(content, is_interactive):
+    result = Statement(encoding="UTF-8")
+    legend = content
+
+    def extract_pattern(pattern):
+        match = pattern.search(legend)
+        if match is None:
+            return None, legend
+        return_value = match.group(1)
+        new_legend = pattern.sub('', legend)
+        return return_value, new_legend
+
+    def replace_new_command():
+        pattern = re.compile(r"\\newcommand\s*\{?\s*(\\[a-zA-Z][a-zA-Z0-9]+)\s*}?\s*\{([^}]+)}", flags=re.S)
+        vars = {}
+        for match in pattern.finditer(legend):
+            vars[match.group(1)] = match.group(2)
+        new_legend = pattern.sub('', legend)
+        for var, value in vars.items():
+            new_legend = new_legend.replace(var + "{}", value)
+            new_legend = new_legend.replace(var, value)
+        return new_legend
+
+    def extract_latex_tag_block(tag_name):
+        return extract_pattern(re.compile(r"\\begin\{%s}(.*)\\end\{%s}" % (tag_name, tag_name), flags=re.S))
+
+    def extract_section(tag_name):
+        return extract_pattern(re.compile(r"\\(?:sub)?section[*]?\{%s}(.*)" % tag_name, flags=re.S))
+
+    def extract_latex_tag(tag_name):
+        return extract_pattern(re.compile(r"\\%s\{([^}]*)}" % tag_name, flags=re.S))
+
+    def extract_input_output(tag_name):
+        if re.search(r"\\(?:sub)?section[*]?\{%s}(.*)" % tag_name, legend) is not None:
+            return extract_section(tag_name)
+        else:
+            return extract_latex_tag_block(tag_name)
+
+    def replace_formula_brackets():
+        return legend.replace('\\(', '$').replace('\\)', '$')
+
+    legend = replace_new_command()
+    legend = replace_formula_brackets()
+    result.notes, legend = extract_input_output("(?:Examples?|Notes?)")
+    if is_interactive:
+        result.interaction, legend = extract_input_output("Interaction")
+    result.output, legend = extract_input_output("Output")
+    result.input, legend = extract_input_output("Input")
+    result.name, legend = extract_latex_tag("problemname")
+    result.legend = legend
+    return result
+
+
+def natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def load_testdata_yaml(directory):
+    file = os.path.join(directory, "testdata.yaml")
+    if not os.path.isfile(file):
+        return {}
+    with open(file) as fs:
+        contents = yaml.safe_load(fs) or {}
+    return contents if isinstance(contents, dict) else {}
+
+
+def read_testdata_yaml(directory, inherited):
+    return dict(inherited, **load_testdata_yaml(directory))
+
+
+def validator_flags(testdata, name):
+    """
+    Arguments of the input validator name for the tests of a directory: input_validator_args (a string, a list
+    or a map from the validator name) or the legacy input_validator_flags
+    """
+    flags = testdata.get('input_validator_args', testdata.get('input_validator_flags', ''))
+    if isinstance(flags, dict):
+        flags = flags.get(name, '')
+    if flags is None:
+        return []
+    return str(flags).split() if not isinstance(flags, list) else [str(x) for x in flags]
+
+
+def score_bound(testdata):
+    """
+    The largest score allowed by the settings: scoring: score or the upper end of range, None if neither is set
+    """
+    scoring = testdata.get('scoring') if isinstance(testdata.get('scoring'), dict) else {}
+    if 'score' in scoring:
+        return float(scoring['score'])
+    if 'range' in testdata:
+        return float(str(testdata['range']).split()[-1])
+    return None
+
+
+def testdata_group(testdata, count, own=None):
+    """
+    Maps the scoring settings of a test data group to the score and the scoring of a Polygon group,
+    both the legacy (accept_score, range, grader_flags) and the current (scoring: score, aggregation) ones.
+    testdata are the settings inherited down to the group, own the ones of its own testdata.yaml (the same by
+    default): a score or range of the group itself is its score, one set above it only caps the score of its tests.
+    """
+    own = testdata if own is None else own
+    scoring = testdata.get('scoring') if isinstance(testdata.get('scoring'), dict) else {}
+    flags = str(testdata.get('grader_flags', '')).split()
+    aggregation = scoring.get('aggregation', 'min' if 'min' in flags else 'sum')
+    accept_score = float(testdata.get('accept_score', 1))
+    score = score_bound(own)
+    if score is None:
+        score = accept_score if aggregation == 'min' else accept_score * count
+        cap = score_bound(testdata)
+        if cap is not None:
+            score = min(score, cap)
+    # fractional scores are kept, whole ones are uploaded as integers
+    score = int(score) if score.is_integer() else score
+    return score, GroupScoring.GROUP if aggregation == 'min' else GroupScoring.SUM
+
+
+class ArchiveContents:
+    __slots__ = ('directory', 'entries')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = []
+        # in a fixed order, so that the same package gives the same archive, e.g. for a replayed cassette
+        for dirname, subdirectories, files in os.walk(directory):
+            subdirectories.sort()
+            dirname = os.path.relpath(dirname, directory)
+            if dirname.startswith(os.path.join("data", "secret")):
+                continue
+            self.entries.append(dirname)
+            self.entries += [os.path.join(dirname, filename) for filename in sorted(files)]
+
+    def __call__(self, *args, **kwargs):
+        buffer = io.BytesIO()
+        zip_file = zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED)
+        for entry in self.entries:
+            zip_file.write(os.path.join(self.directory, entry), arcname=entry)
+        zip_file.close()
+        buffer.seek(0)
+        return buffer.read()
+
+    def size(self):
+        # an upper bound of the archive: deflate may grow incompressible data a little (zlib's compressBound),
+        # every entry adds its headers, and the archive is held twice while it is built in memory and read out
+        total = 0
+        for entry in self.entries:
+            path = os.path.join(self.directory, entry)
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            total += size + (size >> 12) + (size >> 14) + 13 + ZIP_ENTRY_OVERHEAD + 2 * len(entry.encode('utf-8'))
+        return 2 * (total + ZIP_END_OVERHEAD)
+
+
+class DomjudgeAdapter(SourceAdapter):
+    name = 'domjudgeimport'
+
+    def __init__(self, directory, options):
+        self.directory = directory
+        self.options = options
+        self.invalid_tests = set()
+        self.validator_dir = None
+        self.description_text = """Imported by domjudge-import
+The statement shouldn't compile, edit it
+The checker is set to wcmp by default, if not set custom checker/validator should be implemented, the original ones are uploaded to resource files
+"""
+        problem_yaml = self.read_problem_yaml()
+        self.is_interactive = False
+        self.is_custom_checker = False
+        self.is_scoring = False
+        if problem_yaml is not None:
+            self.description_text += "\n\n" + problem_yaml.strip()
+            yaml_contents = yaml.safe_load(problem_yaml) or {}
+            if not isinstance(yaml_contents, dict):
+                raise ImportAbortedException("problem.yaml is not a mapping")
+            validation = str(yaml_contents.get("validation") or "")
+            if "interactive" in validation:
+                self.is_interactive = True
+            if "custom" in validation:
+                self.is_custom_checker = True
+            if "scoring" in str(yaml_contents.get("type", "")):
+                self.is_scoring = True
+
+    def cleanup(self):
+        if self.validator_dir is not None:
+            scratch_space.remove_directory(self.validator_dir)
+
+    def read_problem_yaml(self):
+        file = os.path.join(self.directory, "problem.yaml")
+        if os.path.isfile(file):
+            with open(file) as fs:
+                return fs.read()
+        else:
+            return None
 
-    directory = sys.argv[1]
-    polygon_pid = sys.argv[2]
+    def commit_message(self):
+        return "domjudgeimport: %s" % os.path.basename(os.path.abspath(self.directory))
 
-    def upload_from_file(file, file_type, name=None, preprocess=None):
-        if os.path.basename(file) == "testlib.h" and name is None:
-            print("Skipping uploading 'testlib.h'")
-            return False
-        with open(file) as fs:
-            content = fs.read()
-        if preprocess is not None:
-            content = preprocess(content)
-        print('problem.saveFile: ' + file + ("   with name='" + name + "'" if name else ""))
-        try:
-            return prob.save_file(type=file_type,
-                                  name=name if name else os.path.basename(file),
-                                  file=content) is None
-        except PolygonRequestFailedException as e:
-            print("API Error: " + e.comment)
-            return False
-
-    def parse_statement(content):
-        result = Statement(encoding="UTF-8")
-        legend = content
-
-        def extract_pattern(pattern):
-            match = pattern.search(legend)
-            if match is None:
-                return None, legend
-            return_value = match.group(1)
-            new_legend = pattern.sub('', legend)
-            return return_value, new_legend
-
-        def replace_new_command():
-            pattern = re.compile(r"\\newcommand\s*\{?\s*(\\[a-zA-Z][a-zA-Z0-9]+)\s*}?\s*\{([^}]+)}", flags=re.S)
-            vars = {}
-            for match in pattern.finditer(legend):
-                vars[match.group(1)] = match.group(2)
-            new_legend = pattern.sub('', legend)
-            for var, value in vars.items():
-                new_legend = new_legend.replace(var + "{}", value)
-                new_legend = new_legend.replace(var, value)
-            return new_legend
-
-        def extract_latex_tag_block(tag_name):
-            return extract_pattern(re.compile(r"\\begin\{%s}(.*)\\end\{%s}" % (tag_name, tag_name), flags=re.S))
-
-        def extract_section(tag_name):
-            return extract_pattern(re.compile(r"\\(?:sub)?section[*]?\{%s}(.*)" % tag_name, flags=re.S))
-
-        def extract_latex_tag(tag_name):
-            return extract_pattern(re.compile(r"\\%s\{([^}]*)}" % tag_name, flags=re.S))
-
-        def extract_input_output(tag_name):
-            if re.search(r"\\(?:sub)?section[*]?\{%s}(.*)" % tag_name, legend) is not None:
-                return extract_section(tag_name)
-            else:
-                return extract_latex_tag_block(tag_name)
-
-        def replace_formula_brackets():
-            return legend.replace('\\(', '$').replace('\\)', '$')
-
-        legend = replace_new_command()
-        legend = replace_formula_brackets()
-        result.notes, legend = extract_input_output("(?:Examples?|Notes?)")
-        if is_interactive:
-            result.interaction, legend = extract_input_output("Interaction")
-        result.output, legend = extract_input_output("Output")
-        result.input, legend = extract_input_output("Input")
-        result.name, legend = extract_latex_tag("problemname")
-        result.legend = legend
-        return result
-
-    def upload_statement():
-        for lang, lang_polygon in [('en', 'english')]:
-            file = glob.glob(os.path.join(directory, "problem_statement/prob*%s*.tex" % lang))
-            print(file)
-            if len(file) == 0:
-                continue
-            file = file[0]
-            with open(file) as statement_file:
-                content = statement_file.read()
-            print("problem.saveStatement language = " + lang_polygon)
-            polygon_statement = parse_statement(content)
-            try:
-                prob.save_statement(lang=lang_polygon, problem_statement=polygon_statement)
-            except PolygonRequestFailedException as e:
-                print("API Error: " + e.comment)
-
-        solution_file = glob.glob(os.path.join(directory, "problem_statement/sol*.tex"))
-        if len(solution_file) > 0:
-            solution_file = solution_file[0]
-            with open(solution_file) as fs:
-                content = fs.read()
-            try:
-                prob.save_statement(lang="english", problem_statement=Statement(tutorial=content))
-            except PolygonRequestFailedException as e:
-                print("API Error: " + e.comment)
+    def get_test_files(self, test_type):
+        files = glob.glob(os.path.join(self.directory, "data/%s/**/*.in" % test_type), recursive=True)
+        files.sort(key=lambda x: os.path.basename(x))
+        return files
 
-        for file in glob.glob(os.path.join(directory, "problem_statement/**"), recursive=True):
-            if os.path.isfile(file):
-                with open(file, "rb") as fs:
-                    content = fs.read()
-                try:
-                    print("problem.saveStatementResource %s, size = %d bytes" % (file, len(content)))
-                    prob.save_statement_resource(os.path.basename(file), content)
-                except PolygonRequestFailedException as e:
-                    print("API Error: " + e.comment)
-
-    def upload_tests():
-        def get_tests_from_directory(test_type, use_in_statements=False):
-            files = (glob.glob(os.path.join(directory, "data/%s/*.in" % test_type)) +
-                         glob.glob(os.path.join(directory, "data/%s/*/*.in" % test_type)))
-            files.sort(key=lambda x: os.path.basename(x))
-            return [Test(FileContents(file), "domjudgeimport: %s/%s" % (test_type, os.path.basename(file)),
-                         use_in_statements=use_in_statements) for file in files]
-
-        sample_tests = get_tests_from_directory("sample", use_in_statements=True)
-        main_tests = get_tests_from_directory("secret")
-        groups = [
-            Group(0, sample_tests, GroupScoring.SUM),
-            Group(100, main_tests, GroupScoring.SUM),
-        ]
-
-        all_tests = sample_tests + main_tests
+    def has_secret_groups(self):
+        # subdirectories of an ICPC package without scoring settings only organize the tests
+        if self.is_scoring:
+            return True
+        secret = os.path.join(self.directory, "data", "secret")
+        for file in glob.glob(os.path.join(secret, "**", "testdata.yaml"), recursive=True):
+            with open(file) as fs:
+                testdata = yaml.safe_load(fs) or {}
+            if isinstance(testdata, dict) and len(SCORING_KEYS & set(testdata)) > 0:
+                return True
+        return False
+
+    def get_secret_groups(self):
+        """
+        Yields (directory, test files, testdata, own testdata) of the test data groups: the tests right in data/secret
+        and every data/secret/<group> with the tests of all its subdirectories
+        """
+        data = os.path.join(self.directory, "data")
+        secret = os.path.join(data, "secret")
+        testdata = read_testdata_yaml(secret, read_testdata_yaml(data, {}))
+        if not os.path.isdir(secret):
+            return
+        files = sorted(glob.glob(os.path.join(secret, "*.in")), key=natural_key)
+        if len(files) > 0:
+            yield secret, files, testdata, load_testdata_yaml(secret)
+        subdirectories = [x for x in os.listdir(secret) if os.path.isdir(os.path.join(secret, x))]
+        for name in sorted(subdirectories, key=natural_key):
+            directory = os.path.join(secret, name)
+            files = glob.glob(os.path.join(directory, "**", "*.in"), recursive=True)
+            files.sort(key=lambda x: natural_key(os.path.relpath(x, directory)))
+            if len(files) > 0:
+                own = load_testdata_yaml(directory)
+                yield directory, files, dict(testdata, **own), own
+
+    def input_validators(self):
+        """
+        Lists (name, sources) of the C++ input validators: every directory in input_validators
+        (or the legacy input_format_validators) and every C++ file right in it
+        """
+        validators = []
+        for validators_dir in VALIDATOR_DIRECTORIES:
+            path = os.path.join(self.directory, validators_dir)
+            if not os.path.isdir(path):
+                continue
+            for entry in sorted(os.listdir(path)):
+                full_path = os.path.join(path, entry)
+                name, extension = os.path.splitext(entry)
+                if os.path.isdir(full_path):
+                    sources = sorted(x for x in glob.glob(os.path.join(full_path, "*"))
+                                     if os.path.splitext(x)[1] in CPP_EXTENSIONS)
+                    if len(sources) > 0:
+                        validators.append((entry, sources))
+                    else:
+                        print("Warning: validator %s is not written in C++, it is not run locally" % full_path)
+                elif extension in CPP_EXTENSIONS:
+                    validators.append((name, [full_path]))
+                elif extension not in ['.h', '.hpp']:
+                    print("Warning: validator %s is not written in C++, it is not run locally" % full_path)
+        return validators
+
+    def tests_testdata(self, files):
+        """
+        Maps every test file to the testdata.yaml settings of its directory, inherited from data down
+        """
+        data = os.path.normpath(os.path.join(self.directory, "data"))
+        cache = {data: read_testdata_yaml(data, {})}
+
+        def directory_testdata(directory):
+            if directory not in cache:
+                cache[directory] = read_testdata_yaml(directory, directory_testdata(os.path.dirname(directory)))
+            return cache[directory]
+
+        return {file: directory_testdata(os.path.dirname(os.path.normpath(file))) for file in files}
+
+    def prepare(self):
+        validators = self.input_validators()
+        if len(validators) == 0 or 'no-validate' in self.options:
+            return
+        self.validator_dir = create_temporary_directory("__validator")
+        testlib = self.options.get('testlib')
+        if testlib is None and any(uses_testlib(sources) for name, sources in validators):
+            testlib = find_testlib(self.directory)
+        files = self.get_test_files("sample") + self.get_test_files("secret")
+        testdata = self.tests_testdata(files)
+        for name, sources in validators:
+            binary = compile_validator(sources, self.validator_dir, name=name, testlib=testlib)
+            if binary is None:
+                continue
+            results = validate_tests(binary, files, {file: validator_flags(testdata[file], name) for file in files})
+            self.invalid_tests |= set(r.path for r in results if not r.valid)
+        if len(self.invalid_tests) > 0:
+            print("Invalid tests: %s" % sorted(self.invalid_tests))
+            if 'upload-invalid' not in self.options:
+                raise ImportAbortedException("Nothing is uploaded, fix the tests or rerun with --upload-invalid")
+
+    def groups(self):
+        data = os.path.join(self.directory, "data")
+
+        def description(file):
+            result = "domjudgeimport: %s" % os.path.relpath(file, data)
+            if file in self.invalid_tests:
+                result += ", INVALID by the local validator"
+            return result
+
+        sample_tests = TestTable(self.get_test_files("sample"), description, use_in_statements=True)
+        groups = [Group(0, sample_tests, GroupScoring.SUM)]
+        if self.has_secret_groups():
+            for directory, files, testdata, own in self.get_secret_groups():
+                score, scoring = testdata_group(testdata, len(files), own)
+                print("Group %d: %s, %d tests, score %s, %s" % (len(groups), os.path.relpath(directory, data),
+                                                               len(files), score, scoring.name))
+                groups.append(Group(score, TestTable(files, description), scoring))
+        else:
+            groups.append(Group(100, TestTable(self.get_test_files("secret"), description), GroupScoring.SUM))
 
         def get_test_by_prefix(file_path):
             file_name = os.path.basename(file_path)
-            return all_tests[int(file_name[:file_name.find('.')]) - 1]
-
-        if is_interactive:
-            for test_file in sorted(glob.glob(os.path.join(directory, "data/sample/*.interaction"))):
+            index = int(file_name[:file_name.find('.')]) - 1
+            for group in groups:
+                if index < group.count:
+                    return group.tests[index]
+                index -= group.count
+
+        if self.is_interactive:
+            for test_file in sorted(glob.glob(os.path.join(self.directory, "data/sample/*.interaction"))):
                 contents = open(test_file).readlines()
 
                 def cut_if_starts_with(ch, contents):
@@ -166,34 +436,27 @@ def main():
                 test.output_for_statements = cut_if_starts_with('<', contents)
                 test.verify = False
                 test.description += ", non-verified custom input/output from sample/%s" % os.path.basename(test_file)
-        elif is_custom_checker:
-            for test_file in sorted(glob.glob(os.path.join(directory, "data/sample/*.ans"))):
+        elif self.is_custom_checker:
+            for test_file in sorted(glob.glob(os.path.join(self.directory, "data/sample/*.ans"))):
                 test = get_test_by_prefix(test_file)
                 test.use_in_statements = True
                 test.output_for_statements = open(test_file).read()
                 test.verify = True
                 test.description += ", verified custom output from sample/%s" % os.path.basename(test_file)
+        return groups
 
-        upload_groups(prob, groups)
-        for file in (glob.glob(os.path.join(directory, "data/*"))) + glob.glob(os.path.join(directory, "generators/*")):
-            if os.path.isfile(file):
-                if not upload_from_file(file, FileType.SOURCE):
-                    upload_from_file(file, FileType.RESOURCE)
-
-    def upload_solutions():
-        solution_types = [os.path.basename(x) for x in glob.glob(os.path.join(directory, "submissions/*"))]
+    def solutions(self):
+        solution_types = [os.path.basename(x) for x in glob.glob(os.path.join(self.directory, "submissions/*"))]
         tags = {"accepted": SolutionTag.OK, "wrong_answer": SolutionTag.WA, "time_limit_exceeded": SolutionTag.TL,
                 "run_time_error": SolutionTag.RJ}
         id = 1
         for t in solution_types:
             tag = tags.get(t, SolutionTag.RJ)
-            solutions = glob.glob(os.path.join(directory, "submissions/%s/**" % t), recursive=True)
+            solutions = glob.glob(os.path.join(self.directory, "submissions/%s/**" % t), recursive=True)
             solutions = list(filter(lambda x: os.path.isfile(x), solutions))
             solutions.sort(key=lambda x: 0 if x.endswith(".cpp") else 1)
             print(solutions)
-            need_main = tag == SolutionTag.OK
             for file in solutions:
-                code = open(file).read()
                 fname = os.path.basename(file)
                 _, extension = os.path.splitext(fname)
                 if extension != ".java":
@@ -204,74 +467,109 @@ def main():
                     source_types = ["python.pypy3-64", "python.pypy3", "python.3", "python.pypy2", "python.2"]
                 elif extension in [".cpp", ".cc", ".cxx", ".c++"]:
                     source_types = ["cpp.gcc14-64-msys2-g++23", "cpp.g++17", "cpp.msys2-mingw64-9-g++17", "cpp.ms2017", "cpp.gcc11-64-winlibs-g++20"]
-                for source_type in source_types:
-                    print('problem.saveSolution name = %s, sourceType = %s' % (fname, source_type))
-                    try:
-                        prob.save_solution(name=fname,
-                                           file=code,
-                                           source_type=source_type,
-                                           tag=SolutionTag.MA if need_main else tag)
-                        need_main = False
-                        break
-                    except PolygonRequestFailedException as e:
-                        print("API Error: " + e.comment)
-                    except _ as e:
-                        print("Error: " + e.comment)
-
-    def upload_resources(validator_dir):
-        output_validators = (glob.glob(os.path.join(directory, "%s/*/*" % validator_dir)) +
-                             glob.glob(os.path.join(directory, "%s/*" % validator_dir)))
-        if len(output_validators) > 0:
-            for file in output_validators:
+                # the pipeline makes the first accepted solution that it uploads the main one
+                yield SolutionItem(fname, FileContents(file), tag, source_types)
+
+    def statements(self):
+        statement_files = find_language_files(self.directory, "prob")
+        tutorial_files = find_language_files(self.directory, "sol")
+        print("Statements: %s" % statement_files)
+        print("Tutorials: %s" % tutorial_files)
+
+        def read_text(file):
+            with open(file) as fs:
+                return fs.read()
+
+        statements = {lang: parse_statement(read_text(file), self.is_interactive)
+                      for lang, file in statement_files.items()}
+        for lang, file in tutorial_files.items():
+            statements.setdefault(lang, Statement()).tutorial = read_text(file)
+        return [StatementItem(lang, statement) for lang, statement in statements.items()]
+
+    def statement_resources(self):
+        files = []
+        for file in sorted(glob.glob(os.path.join(self.directory, "problem_statement/**"), recursive=True)):
+            if not os.path.isfile(file):
+                continue
+            if is_build_artefact(file):
+                print("Skipping %s, it is a build artefact" % file)
+                continue
+            files.append(file)
+        if 'no-optimize-resources' in self.options:
+            contents = [BinaryFileContents(file) for file in files]
+        else:
+            contents = ResourceOptimizer().optimize_all(files)
+        for file, content in zip(files, contents):
+            yield ResourceItem(file, content, os.path.basename(file))
+
+    def file_item(self, file, file_types, name=None, preprocess=None):
+        if os.path.basename(file) == "testlib.h" and name is None:
+            print("Skipping uploading 'testlib.h'")
+            return None
+        return FileItem(file, FileContents(file), name if name else os.path.basename(file), file_types,
+                        preprocess=preprocess)
+
+    def files(self):
+        items = []
+        for file in (glob.glob(os.path.join(self.directory, "data/*"))) + glob.glob(os.path.join(self.directory, "generators/*")):
+            if os.path.isfile(file):
+                items.append(self.file_item(file, (FileType.SOURCE, FileType.RESOURCE)))
+        for validator_dir in ["output_validators", "input_validators"]:
+            for file in (glob.glob(os.path.join(self.directory, "%s/*/*" % validator_dir)) +
+                         glob.glob(os.path.join(self.directory, "%s/*" % validator_dir))):
                 if os.path.isfile(file):
-                    upload_from_file(file, FileType.RESOURCE)
+                    items.append(self.file_item(file, (FileType.RESOURCE,)))
+        items.append(FileItem("archive.zip", ArchiveContents(self.directory), "archive.zip", (FileType.AUX,)))
+        return [item for item in items if item is not None]
+
+    def checker(self):
+        if len(glob.glob(os.path.join(self.directory, "output_validators"))) == 0:
+            return 'std::wcmp.cpp'
+        checkers = glob.glob(os.path.join(self.directory, "output_validators/main/*.cpp"))
+        if len(checkers) == 0:
+            return None
+        return self.file_item(checkers[-1], (FileType.SOURCE,), name="testlib_checker.cpp")
 
-    def upload_archive_file(file):
-        if os.path.isfile(file):
-            with open(file, "rb") as fs:
-                content = fs.read()
-            print('problem.saveFile: ' + file)
-            try:
-                prob.save_file(type=FileType.AUX,
-                               name=os.path.basename(file),
-                               file=content)
-            except PolygonRequestFailedException as e:
-                print("API Error: " + e.comment)
-
-    def upload_archive():
-        def create_archive_bytes(directory):
-            buffer = io.BytesIO()
-            zip_file = zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED)
-            for dirname, _, files in os.walk(directory):
-                dirname = os.path.relpath(dirname, directory)
-                if dirname.startswith(os.path.join("data", "secret")):
-                    continue
-                zip_file.write(os.path.join(directory, dirname), arcname=dirname)
-                for filename in files:
-                    zip_file.write(
-                        os.path.join(directory, dirname, filename),
-                        arcname=os.path.join(dirname, filename)
-                    )
-            zip_file.close()
-            buffer.seek(0)
-            return buffer.read()
-
-        content = create_archive_bytes(directory)
-        file = "archive.zip"
-        print('problem.saveFile: ' + file)
-        try:
-            prob.save_file(type=FileType.AUX,
-                           name=file,
-                           file=content)
-        except PolygonRequestFailedException as e:
-            print("API Error: " + e.comment)
-
-    def upload_description_and_info(description, is_interactive):
+    def validator(self):
+        validators = glob.glob(os.path.join(self.directory, "input_validators/main/*.cpp"))
+        if len(validators) == 0:
+            return None
+        preprocess = lambda x: re.sub(r'return\s+42\s*;', 'return 0;', x)
+        return self.file_item(validators[-1], (FileType.SOURCE,), name="testlib_validator.cpp", preprocess=preprocess)
+
+    def validator_tests(self):
+        if self.validator() is None:
+            return
+        for file in self.get_test_files("sample"):
+            yield ValidatorTestItem(file, FileContents(file), ValidatorTestVerdict.VALID)
+        for test_type in INVALID_INPUT_DIRECTORIES:
+            for file in self.get_test_files(test_type):
+                yield ValidatorTestItem(file, FileContents(file), ValidatorTestVerdict.INVALID)
+
+    def checker_tests(self):
+        if self.is_interactive or self.checker() is None:
+            return
+        for file in self.get_test_files("sample"):
+            answer = os.path.splitext(file)[0] + ".ans"
+            if os.path.isfile(answer):
+                yield CheckerTestItem(file, FileContents(file), FileContents(answer), FileContents(answer),
+                                      CheckerTestVerdict.OK)
+        for test_type in WRONG_OUTPUT_DIRECTORIES:
+            for file in self.get_test_files(test_type):
+                answer = os.path.splitext(file)[0] + ".ans"
+                output = os.path.splitext(file)[0] + ".out"
+                if os.path.isfile(answer) and os.path.isfile(output):
+                    yield CheckerTestItem(file, FileContents(file), FileContents(output), FileContents(answer),
+                                          CheckerTestVerdict.WRONG_ANSWER)
+                else:
+                    print("Warning: %s has no .ans or .out file, not used as a checker test" % file)
+
+    def info(self):
         info = ProblemInfo()
-        info.interactive = is_interactive
+        info.interactive = self.is_interactive
 
-        time_limit_file = glob.glob(os.path.join(directory, ".timelimit"))
-        domjudge_ini = glob.glob(os.path.join(directory, "domjudge-problem.ini"))
+        time_limit_file = glob.glob(os.path.join(self.directory, ".timelimit"))
+        domjudge_ini = glob.glob(os.path.join(self.directory, "domjudge-problem.ini"))
         info.memory_limit = 1024
         if len(time_limit_file) > 0:
             time_limit_file = time_limit_file[0]
@@ -293,81 +591,43 @@ def main():
                     info.time_limit = "15000"
             except ValueError:
                 print("Error: Time limit is not a valid number.")
-        prob.update_info(info)
+        return info
 
-        print("problem.saveGeneralDescription")
+    def description(self):
         limit = 14000
+        description = self.description_text
         if len(description) > limit:
             description = description[:limit] + "..."
-        prob.save_general_description(description)
+        return description
 
-    def read_problem_yaml():
-        file = os.path.join(directory, "problem.yaml")
-        if os.path.isfile(file):
-            with open(file) as fs:
-                return fs.read()
-        else:
-            return None
 
-    api = authenticate()
-    print("problems.list id = %s" % polygon_pid)
-    prob = list(api.problems_list(name=polygon_pid))
-    to_create = any(map(lambda x: x == '--create', sys.argv))
-    if len(prob) == 0:
-        if to_create and not polygon_pid.isdigit():
-            prob = [api.problem_create(name=polygon_pid)]
-        else:
-            print("Problem %s not found" % polygon_pid)
-            exit(1)
-    prob = prob[0]
-    print("problem.enablePoints")
-    prob.enable_points(True)
-    print("problem.enableGroups")
-    prob.enable_groups('tests', True)
-
-    description = """Imported by domjudge-import
-The statement shouldn't compile, edit it
-The checker is set to wcmp by default, if not set custom checker/validator should be implemented, the original ones are uploaded to resource files
-"""
-    problem_yaml = read_problem_yaml()
-    is_interactive = False
-    is_custom_checker = False
-    if problem_yaml is not None:
-        description += "\n\n" + problem_yaml.strip()
-        yaml_contents = yaml.safe_load(problem_yaml)
-        if "validation" in yaml_contents:
-            if "interactive" in yaml_contents["validation"]:
-                is_interactive = True
-            if "custom" in yaml_contents["validation"]:
-                is_custom_checker = True
-
-    upload_tests()
-
-    upload_solutions()
-
-    upload_statement()
-
-    if len(glob.glob(os.path.join(directory, "output_validators"))) == 0:
-        print("problem.setChecker std::wcmp.cpp")
-        prob.set_checker('std::wcmp.cpp')
-    else:
-        name = "testlib_checker.cpp"
-        for checker in glob.glob(os.path.join(directory, "output_validators/main/*.cpp")):
-            if upload_from_file(checker, FileType.SOURCE, name=name):
-                prob.set_checker(name)
-
-    if len(glob.glob(os.path.join(directory, "input_validators/main"))) > 0:
-        name = "testlib_validator.cpp"
-        for validator in glob.glob(os.path.join(directory, "input_validators/main/*.cpp")):
-            preprocess = lambda x: re.sub(r'return\s+42\s*;', 'return 0;', x)
-            if upload_from_file(validator, FileType.SOURCE, name=name, preprocess=preprocess):
-                prob.set_validator(name)
-
-    upload_resources("output_validators")
-    upload_resources("input_validators")
-    upload_description_and_info(description, is_interactive)
-
-    upload_archive()
+def import_domjudge(directory, polygon_pid, client=None, options=None):
+    """
+    Imports the DOMjudge package in directory into a Polygon problem in this process, see run_import
+    """
+    return run_import(functools.partial(DomjudgeAdapter, directory, options or {}), polygon_pid, client, options)
+
+
+def print_usage():
+    print("Usage: domjudgeimport <problem_directory> <polygon problem id> [--create] [--resume] [--no-validate] "
+          "[--testlib=<testlib.h>] [--upload-invalid] [--memory-budget=<bytes>] [--no-commit] [--no-discard] "
+          "[--build-package[=full]] [--workers=<count>] [--profile[=<directory>]] [--normalize[=spaces]] "
+          "[--no-optimize-resources] "
+          "[--record=<cassette> | --replay=<cassette> [--replay-latency=recorded|<seconds>]]")
+    print("Example: domjudgeimport bapc2022/adjustedaverage 123123")
+    print("Version: " + __version__)
+
+
+def main():
+    arguments, options = split_arguments(sys.argv[1:])
+    if len(arguments) < 2:
+        print_usage()
+        exit(239)
+
+    directory = arguments[0]
+    polygon_pid = arguments[1]
+    configure_process(options, print_usage)
+    finish_import(import_domjudge(directory, polygon_pid, options=options))
 
 
 #     tags = ['usaco']
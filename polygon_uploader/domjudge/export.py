@@ -0,0 +1,274 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import yaml
+from polygon_api import (
+    FileType,
+    SolutionTag,
+    HTTPRequestFailedException,
+    PolygonRequestFailedException,
+)
+from requests import RequestException
+
+from ..common import *
+from ..common.file_download import download_polygon_to
+from ..common.polygon import with_retries, worker_pool
+from .domjudge import LANGUAGES
+from .. import __version__
+
+MANIFEST_FILE = '.polygon_export.json'
+TESTSET = 'tests'
+DOWNLOAD_WORKERS = 16
+
+SUBMISSION_DIRECTORIES = {
+    SolutionTag.MA: 'accepted',
+    SolutionTag.OK: 'accepted',
+    SolutionTag.WA: 'wrong_answer',
+    SolutionTag.PE: 'wrong_answer',
+    SolutionTag.TL: 'time_limit_exceeded',
+    SolutionTag.ML: 'run_time_error',
+    SolutionTag.RE: 'run_time_error',
+}
+STANDARD_CHECKER_FLAGS = {
+    'std::wcmp.cpp': None,
+    'std::ncmp.cpp': None,
+    'std::rcmp4.cpp': 'float_tolerance 1e-4',
+    'std::rcmp6.cpp': 'float_tolerance 1e-6',
+    'std::rcmp9.cpp': 'float_tolerance 1e-9',
+}
+LANGUAGE_CODES = {}
+for code, language in LANGUAGES.items():
+    LANGUAGE_CODES.setdefault(language, code)
+
+
+class ExportItem:
+    __slots__ = ('path', 'method', 'args', 'fingerprint')
+
+    def __init__(self, path, method, args, fingerprint):
+        self.path = path
+        self.method = method
+        self.args = args
+        self.fingerprint = fingerprint
+
+
+def statement_to_latex(statement):
+    parts = []
+    if statement.name:
+        parts.append("\\problemname{%s}" % statement.name)
+    if statement.legend:
+        parts.append(statement.legend)
+    # the order matters: domjudgeimport cuts the sections from the end of the text
+    for title, text in [("Input", statement.input), ("Output", statement.output), ("Scoring", statement.scoring),
+                        ("Interaction", statement.interaction), ("Notes", statement.notes)]:
+        if text:
+            parts.append("\\section*{%s}\n%s" % (title, text))
+    return "\n\n".join(parts) + "\n"
+
+
+class DomjudgeExporter:
+    def __init__(self, api, prob, directory, incremental=False, workers=DOWNLOAD_WORKERS):
+        self.api = api
+        self.prob = prob
+        self.directory = directory
+        self.incremental = incremental
+        self.workers = workers
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        # the manifest of the previous export is always read, so that removed items are removed from the package
+        self.manifest = self.load_manifest()
+        self.items = []
+        self.expected = set()
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def load_manifest(self):
+        if not os.path.isfile(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        with open(self.manifest_path + '.part', 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(self.manifest_path + '.part', self.manifest_path)
+
+    def plan(self, path, method, args, fingerprint):
+        """
+        Schedules a download, unless the file is there and its fingerprint is unchanged.
+        A fingerprint of None means that the item cannot be checked and is always downloaded.
+        """
+        self.expected.add(path)
+        if self.incremental and fingerprint is not None and self.manifest.get(path) == fingerprint and \
+                os.path.isfile(os.path.join(self.directory, path)):
+            self.skipped += 1
+            return
+        args = dict(args, problemId=self.prob.id)
+        self.items.append(ExportItem(path, method, args, fingerprint))
+
+    def write_text(self, path, text):
+        self.expected.add(path)
+        self.manifest[path] = None
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def run(self):
+        start = time.perf_counter()
+        print("problem.info")
+        info = self.prob.info()
+        print("problem.files")
+        files = self.prob.files()
+        print("problem.solutions")
+        solutions = self.prob.solutions()
+        sources = sorted((f.name, f.modification_time_seconds) for f in files[FileType.SOURCE])
+        main_solution = [(s.name, s.modification_time_seconds) for s in solutions if s.tag == SolutionTag.MA]
+
+        checker = self.prob.interactor() if info.interactive else self.prob.checker()
+        validator = self.prob.validator()
+        self.plan_tests(sources, main_solution)
+        self.plan_solutions(solutions)
+        self.plan_files(files, checker, validator)
+        self.plan_statements()
+        self.write_problem_yaml(info, checker)
+
+        print("Downloading %d items with %d workers, %d unchanged items skipped"
+              % (len(self.items), self.workers, self.skipped))
+        failed = []
+        total_size = 0
+        with worker_pool(self.workers) as pool:
+            futures = [(item, pool.submit(self.download, item)) for item in self.items]
+            for item, future in futures:
+                try:
+                    total_size += future.result()
+                except (PolygonRequestFailedException, HTTPRequestFailedException, RequestException) as e:
+                    print("Failed to download %s: %s" % (item.path, getattr(e, 'comment', e)))
+                    failed.append(item.path)
+                    self.manifest.pop(item.path, None)
+        self.remove_stale()
+        self.save_manifest()
+        print("Exported problem %s to %s: %d items (%d bytes) downloaded in %.3f s, %d unchanged, %d failed"
+              % (self.prob.id, self.directory, len(self.items) - len(failed), total_size,
+                 time.perf_counter() - start, self.skipped, len(failed)))
+        return failed
+
+    def download(self, item):
+        path = os.path.join(self.directory, item.path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = with_retries(lambda: download_polygon_to(self.api, item.method, item.args, path))
+        print("%s: %d bytes" % (item.path, size))
+        with self.lock:
+            self.manifest[item.path] = item.fingerprint
+        return size
+
+    def remove_stale(self):
+        for path in sorted(set(self.manifest) - self.expected):
+            print("Removing %s, it is not in the problem anymore" % path)
+            del self.manifest[path]
+            if os.path.isfile(os.path.join(self.directory, path)):
+                os.remove(os.path.join(self.directory, path))
+
+    def plan_tests(self, sources, main_solution):
+        print("problem.tests testset = %s" % TESTSET)
+        tests = self.prob.tests(TESTSET, no_inputs=True)
+        width = max(2, len(str(max([test.index for test in tests], default=0))))
+        # manual tests can only change together with the problem, generated ones with their script line and sources
+        manual = None if self.prob.modified else "revision %s" % self.prob.revision
+        for test in tests:
+            name = "data/%s/%0*d" % ("sample" if test.use_in_statements else "secret", width, test.index)
+            if hasattr(test, 'script_line'):
+                fingerprint = json.dumps([test.script_line, sources])
+            else:
+                fingerprint = manual
+            args = {'testset': TESTSET, 'testIndex': test.index}
+            self.plan(name + ".in", 'problem.testInput', args, fingerprint)
+            self.plan(name + ".ans", 'problem.testAnswer', args,
+                      None if fingerprint is None else json.dumps([fingerprint, main_solution]))
+
+    def plan_solutions(self, solutions):
+        for solution in solutions:
+            directory = SUBMISSION_DIRECTORIES.get(solution.tag)
+            if directory is None:
+                print("Solution %s with tag %s has no DOMjudge verdict, skipped" % (solution.name, solution.tag))
+                continue
+            self.plan("submissions/%s/%s" % (directory, solution.name), 'problem.viewSolution',
+                      {'name': solution.name}, json.dumps([solution.modification_time_seconds, solution.length]))
+
+    def plan_files(self, files, checker, validator):
+        for file_type in [FileType.SOURCE, FileType.RESOURCE]:
+            for file in files[file_type]:
+                if file.name == "testlib.h":
+                    continue
+                if file.name == checker:
+                    directory = "output_validators/main"
+                elif file.name == validator:
+                    directory = "input_validators/main"
+                else:
+                    directory = "generators"
+                self.plan("%s/%s" % (directory, file.name), 'problem.viewFile',
+                          {'type': file_type, 'name': file.name},
+                          json.dumps([file.modification_time_seconds, file.length]))
+
+    def plan_statements(self):
+        print("problem.statements")
+        for language, statement in self.prob.statements().items():
+            code = LANGUAGE_CODES.get(language)
+            if code is None:
+                print("Statement language %s has no ISO code, skipped" % language)
+                continue
+            self.write_text("problem_statement/problem.%s.tex" % code, statement_to_latex(statement))
+            if statement.tutorial:
+                self.write_text("problem_statement/solution.%s.tex" % code, statement.tutorial + "\n")
+        print("problem.statementResources")
+        for resource in self.prob.statement_resources():
+            self.plan("problem_statement/%s" % resource.name, 'problem.viewStatementResource',
+                      {'name': resource.name}, json.dumps([resource.modification_time_seconds, resource.length]))
+
+    def write_problem_yaml(self, info, checker):
+        problem_yaml = {'name': self.prob.name}
+        if info.memory_limit is not None:
+            problem_yaml['limits'] = {'memory': int(info.memory_limit)}
+        if info.interactive:
+            problem_yaml['validation'] = 'custom interactive'
+        elif checker is not None and not checker.startswith('std::'):
+            problem_yaml['validation'] = 'custom'
+        elif checker in STANDARD_CHECKER_FLAGS:
+            if STANDARD_CHECKER_FLAGS[checker] is not None:
+                problem_yaml['validator_flags'] = STANDARD_CHECKER_FLAGS[checker]
+        elif checker is not None:
+            print("Warning: %s has no DOMjudge equivalent, the default comparison is used" % checker)
+        self.write_text("problem.yaml", yaml.safe_dump(problem_yaml, default_flow_style=False, sort_keys=False))
+        if info.time_limit is not None:
+            self.write_text(".timelimit", "%g\n" % (info.time_limit / 1000))
+
+
+def main():
+    arguments, options = split_arguments(sys.argv[1:])
+    if len(arguments) != 2:
+        print("Usage: domjudgeexport <polygon problem id> <problem_directory> [--incremental] [--workers=<count>] "
+              "[--record=<cassette> | --replay=<cassette> [--replay-latency=recorded|<seconds>]]")
+        print("Example: domjudgeexport 123123 bapc2022/adjustedaverage")
+        print("Version: " + __version__)
+        exit(239)
+
+    polygon_pid = arguments[0]
+    directory = arguments[1]
+    install_cassette(options)
+    api = authenticate()
+    try:
+        prob = find_problem(api, polygon_pid)
+    except ImportAbortedException as e:
+        print(e.comment)
+        exit(1)
+    os.makedirs(directory, exist_ok=True)
+    exporter = DomjudgeExporter(api, prob, directory, incremental='incremental' in options,
+                                workers=int(options.get('workers', DOWNLOAD_WORKERS)))
+    failed = exporter.run()
+    if len(failed) > 0:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
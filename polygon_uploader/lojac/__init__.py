@@ -1 +1 @@
-from .lojac import main
+from .lojac import main, import_lojac
@@ -3,11 +3,11 @@ from polygon_api import (
     SolutionTag,
     ProblemInfo,
     Statement,
-    PolygonRequestFailedException,
     ResourceAdvancedProperties,
     Stage,
     Asset
 )
+import functools
 import html
 import sys
 import os
@@ -20,36 +20,55 @@ import hashlib
 __version__ = '1.0'
 __author__ = 'Niyaz Nigmatullin'
 
-if len(sys.argv) < 3 or len(sys.argv) > 4:
-    print("Usage: lojacimport <loj problem id> <polygon problem id> [<number of tests in groups separated by comma>]")
-    print("Example: lojacimport 3208 aplusb-light 1,1,3,2,3,3,4")
-    exit(239)
-
-
-def main():
-    loj_pid = sys.argv[1]
-    polygon_pid = sys.argv[2]
-    groupsizes = [] if len(sys.argv) < 4 else [int(x) for x in sys.argv[3].split(',')]
-
-    problem_href = 'https://loj.ac/problem/%s' % loj_pid
-    solutions_href = 'https://loj.ac/problem/%s/statistics/fastest' % loj_pid
-    testdata_href = 'https://loj.ac/problem/%s/testdata/download' % loj_pid
-    submission_href = 'https://loj.ac/submission/%s'
 
-    dir = create_temporary_directory(prefix='_loj_%s' % loj_pid)
+def print_usage():
+    print("Usage: lojacimport <loj problem id> <polygon problem id> [<number of tests in groups separated by comma>] "
+          "[--resume] [--memory-budget=<bytes>] [--no-commit] [--no-discard] [--build-package[=full]] "
+          "[--workers=<count>] [--profile[=<directory>]] [--scratch-dir=<dir>] [--fast-scratch-dir=<dir>] "
+          "[--fast-scratch-limit=<bytes>] [--scratch-quota=<bytes>] [--normalize[=spaces]] "
+          "[--record=<cassette> | --replay=<cassette> [--replay-latency=recorded|<seconds>]]")
+    print("Example: lojacimport 3208 aplusb-light 1,1,3,2,3,3,4")
 
-    def get_main_page():
-        nonlocal main_page
-        if main_page is None:
-            main_page = download_web_page(problem_href)
-        return main_page
 
-    def download_sample_tests():
+class LojacAdapter(SourceAdapter):
+    name = 'lojacimport'
+
+    def __init__(self, loj_pid, groupsizes):
+        self.loj_pid = loj_pid
+        self.groupsizes = groupsizes
+        self.problem_href = 'https://loj.ac/problem/%s' % loj_pid
+        self.solutions_href = 'https://loj.ac/problem/%s/statistics/fastest' % loj_pid
+        self.testdata_href = 'https://loj.ac/problem/%s/testdata/download' % loj_pid
+        self.submission_href = 'https://loj.ac/submission/%s'
+        self.dir = None
+        self.tests_dir = None
+        self.main_page = None
+        self.zip_archive = None
+        self.data_yml = None
+        self.group_scores = None
+
+    def commit_message(self):
+        return "lojacimport: %s" % self.loj_pid
+
+    def prepare(self):
+        self.dir = scratch_space.create_directory('_loj_%s' % self.loj_pid)
+
+    def cleanup(self):
+        for directory in [self.dir, self.tests_dir]:
+            if directory is not None:
+                scratch_space.remove_directory(directory)
+
+    def get_main_page(self):
+        if self.main_page is None:
+            self.main_page = download_web_page(self.problem_href)
+        return self.main_page
+
+    def download_sample_tests(self):
         reg_exp = re.compile(r"<pre[^<]*<code>([^<]*)[^<]</code>[^<]*</pre", re.DOTALL)
-        return reg_exp.findall(get_main_page())[0::2]
+        return reg_exp.findall(self.get_main_page())[0::2]
 
-    def set_tl_and_ml():
-        s = get_main_page()
+    def info(self):
+        s = self.get_main_page()
         ml_rexp = re.compile(r"<span class[^>]*>[^0-9<]*(\d+)[^0-9<M]*MiB[^<]*</span>", re.DOTALL)
         ml = ml_rexp.findall(s)
         if len(ml) > 0:
@@ -63,31 +82,44 @@ def main():
         else:
             tl = None
         print('Set ML = %s MiB and TL = %s ms' % (str(ml), str(tl)))
-        prob.update_info(ProblemInfo(time_limit=tl, memory_limit=ml))
+        return ProblemInfo(time_limit=tl, memory_limit=ml)
 
-    def set_statement_scoring():
+    def statements(self):
+        if self.group_scores is None:
+            return []
+        items = []
         for lang, subtask, points in [("russian", "Подзадача", "баллов"), ("english", "Subtask", "points")]:
             s = '\\begin{tabular}{ll}\n'
-            for group, score in enumerate(group_scores, start=1):
+            for group, score in enumerate(self.group_scores, start=1):
                 s += "\\textbf{%s %d (%d %s):} & \\\\\n" % (subtask, group, score, points)
             s += '\\end{tabular}\n'
-            print("problem.saveStatement lang=%s" % lang)
-            prob.save_statement(lang, Statement(output=s))
-
-    def download_tests(dir, tests_dir):
-        tests_archive = os.path.join(dir, "tests.zip")
-        download_file_to(testdata_href, tests_archive)
+            items.append(StatementItem(lang, Statement(output=s)))
+        return items
+
+    def download_archive(self):
+        if self.zip_archive is not None:
+            return self.zip_archive
+        tests_archive = os.path.join(self.dir, "tests.zip")
+        download_file_to(self.testdata_href, tests_archive)
+        scratch_space.charge(os.path.getsize(tests_archive))
         print(tests_archive, "downloaded")
-        zip_archive = zipfile.ZipFile(tests_archive, 'r')
+        self.zip_archive = zipfile.ZipFile(tests_archive, 'r')
+        if 'data.yml' in self.zip_archive.namelist():
+            with self.zip_archive.open('data.yml') as dy:
+                self.data_yml = yaml.load(dy.read().decode('utf-8'), Loader=yaml.BaseLoader)
+        return self.zip_archive
+
+    def groups(self):
+        zip_archive = self.download_archive()
         file_list = zip_archive.namelist()
+        tests_dir = None
 
-        def file_to_test(name):
-            return Test(FileContents(os.path.join(tests_dir, name)), 'lojacimport: filename = %s' % name)
+        def files_to_tests(names):
+            return TestTable([os.path.join(tests_dir, name) for name in names],
+                             lambda path: 'lojacimport: filename = %s' % os.path.relpath(path, tests_dir))
 
-        if 'data.yml' in file_list:
-            zip_archive.extractall(path=tests_dir, members=["data.yml"])
-            with open(os.path.join(tests_dir, 'data.yml'), "r", encoding="utf-8") as dy:
-                f = yaml.load(dy.read(), Loader=yaml.BaseLoader)
+        if self.data_yml is not None:
+            f = self.data_yml
             input_mask = f['inputFile'].replace('#', '%s')
 
             for i, subtask in enumerate(f['subtasks']):
@@ -95,74 +127,36 @@ def main():
                     f['subtasks'] = [subtask] + f['subtasks'][:i] + f['subtasks'][i+1:]
                     break
 
+            to_extract = [input_mask % t for sub in f['subtasks'] for t in sub['cases']]
+            print("Extracting %d tests" % len(to_extract))
+            tests_dir = self.tests_dir = scratch_space.extract(zip_archive, to_extract, '_loj_%s_tests' % self.loj_pid)
+
             groups = []
 
             if int(f['subtasks'][0]['score']) != 0:
                 print("No group with score = 0, downloading sample tests from the web page")
-                description = 'lojacimport: parsed page %s' % problem_href
-                sample_tests = [Test(MemoryContents(x), description, use_in_statements=True) for x in download_sample_tests()]
+                description = 'lojacimport: parsed page %s' % self.problem_href
+                sample_tests = [Test(MemoryContents(x), description, use_in_statements=True) for x in self.download_sample_tests()]
                 groups.append(Group(0, sample_tests, GroupScoring.SUM))
 
-            to_extract = []
             for group, sub in enumerate(f['subtasks'], start=len(groups)):
                 score = sub['score']
                 if sub['type'] != 'min':
                     raise Exception("Only min is supported")
-                tests = []
-                for t in sub['cases']:
-                    name = input_mask % t
-                    to_extract.append(name)
-                    tests.append(file_to_test(name))
-                groups.append(Group(int(score), tests, GroupScoring.GROUP))
-
-            nonlocal group_scores
-            group_scores = [g.score for gid, g in enumerate(groups) if gid != 0]
-
-            print("Extracting %d tests to " % len(to_extract) + tests_dir)
-            zip_archive.extractall(path=tests_dir, members=to_extract)
-            upload_groups(prob, groups)
-
-            if 'specialJudge' in f:
-                checker = f['specialJudge']
-                checker_name = checker['fileName']
-                checker_language = checker['language']
-                zip_archive.extract(checker_name, dir)
-                print("Adding and setting checker file with name %s" % checker_name)
-                with open(os.path.join(dir, checker_name), "r", encoding="utf-8") as cf:
-                    prob.save_file(FileType.SOURCE, checker_name, cf.read())
-                prob.set_checker(checker_name)
-            else:
-                print("No special judge, setting std::ncmp.cpp as checker")
-                prob.set_checker("std::ncmp.cpp")
-            if 'extraSourceFiles' in f:
-                extra = [x for x in f['extraSourceFiles'] if x['language'] == 'cpp']
-                if len(extra) == 0:
-                    print("WARNING: No extra source files for C++")
-                else:
-                    extra = extra[0]
-                    extra = extra['files']
-                    print(extra)
-                    for e_file in extra:
-                        print(e_file)
-                        e_name = e_file['name']
-                        e_dest = e_file['dest']
-                        zip_archive.extract(e_name, dir)
-                        print("Adding extra source file %s" % e_dest)
-                        with open(os.path.join(dir, e_name), "r", encoding="utf-8") as ef:
-                            props = ResourceAdvancedProperties(for_types="cpp.*",
-                                                               stages=[Stage.COMPILE],
-                                                               assets=[Asset.SOLUTION])
-                            prob.save_file(FileType.RESOURCE, e_dest, ef.read(), resource_advanced_properties=props)
+                names = [input_mask % t for t in sub['cases']]
+                groups.append(Group(int(score), files_to_tests(names), GroupScoring.GROUP))
 
+            self.group_scores = [g.score for gid, g in enumerate(groups) if gid != 0]
+            return groups
         else:
-            sample_tests = download_sample_tests()
+            sample_tests = self.download_sample_tests()
             hashes = set(hashlib.md5(x) for x in sample_tests)
             groups = [Group(0, [lambda: x for x in sample_tests], GroupScoring.SUM)]
             testlist = [x for x in file_list if x.endswith('.in')]
             testlist.sort(key=lambda x: int(re.match(r'.*\D(\d+).in', x).group(1)))
             print('tests = ', testlist)
-            zip_archive.extractall(path=tests_dir, members=testlist)
-            print(tests_archive, 'extracted to', tests_dir)
+            tests_dir = self.tests_dir = scratch_space.extract(zip_archive, testlist, '_loj_%s_tests' % self.loj_pid)
+            print(zip_archive.filename, 'extracted to', tests_dir)
 
             def is_sample(name):
                 with os.path.join(tests_dir, name) as tf:
@@ -170,71 +164,107 @@ def main():
 
             testlist = list(filter(lambda x: not is_sample(x), testlist))
 
-            if len(groupsizes) > 0:
+            if len(self.groupsizes) > 0:
                 cnt = len(testlist)
                 points = [100 // cnt] * (cnt - 100 % cnt) + [100 // cnt + 1] * (100 % cnt)
-                for c in groupsizes:
+                for c in self.groupsizes:
                     score = sum(points[:c])
-                    tests = [file_to_test(x) for x in testlist[:c]]
+                    tests = files_to_tests(testlist[:c])
                     groups.append(Group(score, tests, GroupScoring.GROUP))
                     testlist = testlist[c:]
                     points = points[c:]
             else:
-                groups.append(Group(100, [file_to_test(x) for x in testlist], GroupScoring.SUM))
-
-    def download_solutions():
-        page = download_web_page(solutions_href)
+                groups.append(Group(100, files_to_tests(testlist), GroupScoring.SUM))
+            return groups
+
+    def checker(self):
+        self.download_archive()
+        if self.data_yml is None:
+            return None
+        if 'specialJudge' in self.data_yml:
+            checker = self.data_yml['specialJudge']
+            checker_name = checker['fileName']
+            checker_language = checker['language']
+            self.zip_archive.extract(checker_name, self.dir)
+            print("Adding and setting checker file with name %s" % checker_name)
+            path = os.path.join(self.dir, checker_name)
+            return FileItem(path, FileContents(path), checker_name, (FileType.SOURCE,))
+        else:
+            print("No special judge, setting std::ncmp.cpp as checker")
+            return "std::ncmp.cpp"
+
+    def files(self):
+        self.download_archive()
+        if self.data_yml is None or 'extraSourceFiles' not in self.data_yml:
+            return []
+        extra = [x for x in self.data_yml['extraSourceFiles'] if x['language'] == 'cpp']
+        if len(extra) == 0:
+            print("WARNING: No extra source files for C++")
+            return []
+        extra = extra[0]
+        extra = extra['files']
+        print(extra)
+        items = []
+        for e_file in extra:
+            print(e_file)
+            e_name = e_file['name']
+            e_dest = e_file['dest']
+            self.zip_archive.extract(e_name, self.dir)
+            print("Adding extra source file %s" % e_dest)
+            props = ResourceAdvancedProperties(for_types="cpp.*",
+                                               stages=[Stage.COMPILE],
+                                               assets=[Asset.SOLUTION])
+            path = os.path.join(self.dir, e_name)
+            items.append(FileItem(path, FileContents(path), e_dest, (FileType.RESOURCE,),
+                                  resource_advanced_properties=props))
+        return items
+
+    def solutions(self):
+        page = download_web_page(self.solutions_href)
         submissions = list(set(int(x) for x in re.findall(r'href="/submission/(\d+)"', page)))
-        tag = SolutionTag.MA
-        uploaded = 0
+        downloaded = 0
         for sub_id in submissions:
-            if uploaded >= 3:
+            if downloaded >= 3:
                 break
             try:
-                submission_page = download_web_page(submission_href % sub_id)
+                submission_page = download_web_page(self.submission_href % sub_id)
                 code = [x for x in submission_page.splitlines() if x.startswith("const format")][0]
                 start = code.find('"')
                 end = code.rfind('"')
                 code = code[start + 1:end]
                 code = re.sub(r'</?span[^>]*>', '', html.unescape(code.encode('ascii').decode('unicode-escape')))
-                print("problem.saveSolution %s.cpp language cpp.g++17" % sub_id)
-                prob.save_solution("%s.cpp" % sub_id, code, "cpp.g++17", tag)
-                tag = SolutionTag.OK
-                uploaded += 1
             except Exception as exc:
-                print("Solution upload error: " + str(exc))
-
-    api = authenticate()
-    print("problems.list")
-    prob = list(api.problems_list(id=polygon_pid))
-    if len(prob) == 0:
-        print("Problem %s not found" % polygon_pid)
-        exit(1)
-    prob = prob[0]
-    group_scores = None
-    main_page = None
-    print("problem.enablePoints")
-    prob.enable_points(True)
-    print("problem.enableGroups")
-    prob.enable_groups('tests', True)
-
-    tests_dir = os.path.join(dir, "tests")
-    os.mkdir(tests_dir)
-    download_tests(dir, tests_dir)
-
-    download_solutions()
-
-    set_tl_and_ml()
-    if group_scores is not None:
-        set_statement_scoring()
-
-    description = """Imported by lojacimport from %s
+                print("Solution download error: " + str(exc))
+                continue
+            yield SolutionItem("%s.cpp" % sub_id, MemoryContents(code), SolutionTag.OK, ["cpp.g++17"])
+            downloaded += 1
+
+    def description(self):
+        return """Imported by lojacimport from %s
 Statements, group dependencies should be imported manually
 The solution is taken among random correct solutions on loj.ac
-""" % problem_href
-    print("problem.saveGeneralDescription: " + description)
-    prob.save_general_description(description)
+""" % self.problem_href
+
+
+def import_lojac(loj_pid, polygon_pid, groupsizes=None, client=None, options=None):
+    """
+    Imports a LibreOJ problem into a Polygon problem in this process, see run_import
+    """
+    return run_import(functools.partial(LojacAdapter, loj_pid, groupsizes or []), polygon_pid, client, options)
+
+
+def main():
+    arguments, options = split_arguments(sys.argv[1:])
+    if len(arguments) < 2 or len(arguments) > 3:
+        print_usage()
+        exit(239)
+    loj_pid = arguments[0]
+    polygon_pid = arguments[1]
+    groupsizes = [] if len(arguments) < 3 else [int(x) for x in arguments[2].split(',')]
+
+    configure_process(options, print_usage)
+    finish_import(import_lojac(loj_pid, polygon_pid, groupsizes, options=options))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
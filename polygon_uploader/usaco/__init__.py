@@ -1 +1 @@
-from .usaco import main
+from .usaco import main, import_usaco
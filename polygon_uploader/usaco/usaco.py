@@ -2,8 +2,8 @@ from bs4 import BeautifulSoup
 from polygon_api import (
     SolutionTag,
     Statement,
-    PolygonRequestFailedException,
 )
+import functools
 import sys
 import os
 import zipfile
@@ -14,62 +14,107 @@ import polygon_uploader
 __version__ = polygon_uploader.__version__
 __author__ = 'Niyaz Nigmatullin'
 
-if len(sys.argv) != 4:
+
+def print_usage():
     print(
-        "Usage: usacoimport <usaco_cp_id> <usaco_id> <polygon problem id>")  # [<number of tests in groups separated
+        "Usage: usacoimport <usaco_cp_id> <usaco_id> <polygon problem id> [--resume] [--memory-budget=<bytes>] "
+        "[--no-commit] [--no-discard] [--build-package[=full]] [--workers=<count>] "
+        "[--profile[=<directory>]] [--scratch-dir=<dir>] [--fast-scratch-dir=<dir>] [--fast-scratch-limit=<bytes>] "
+        "[--scratch-quota=<bytes>] [--normalize[=spaces]] "
+        "[--record=<cassette> | --replay=<cassette> [--replay-latency=recorded|<seconds>]]")  # [<number of tests in groups separated
     # by comma>]
+    print("       usacoimport --contest=<contest results page> <polygon problem ids separated by comma>")
     print("Example: usacoimport 1020 deleg_platinum_feb20 123123")
+    print("Example: usacoimport --contest=feb20results 123101,123102,123103,123104")
     print(
         "usaco_cp_id is taken from the problem description link: "
         "http://usaco.org/index.php?page=viewproblem2&cpid=1020, usaco_cp_id=1020")
     print(
         "usaco_id is taken from testdata link: http://usaco.org/current/data/deleg_platinum_feb20.zip, "
         "usaco_id=deleg_platinum_feb20")
+    print(
+        "contest results page is taken from the contest link: http://usaco.org/index.php?page=feb20results, "
+        "the problems are imported in the order they appear on the page")
     print("Version: " + __version__)
-    exit(239)
 
 
-def main():
-    cpid = sys.argv[1]
-    usaco_id = sys.argv[2]
-    polygon_pid = sys.argv[3]
-    # groupsizes = [] if len(sys.argv) < 5 else [int(x) for x in sys.argv[4].split(',')]
-    dir = create_temporary_directory("__usaco")
-
-    problem_href = 'http://usaco.org/index.php?page=viewproblem2&cpid=%s' % cpid
-    solution_href = 'http://usaco.org/current/data/sol_%s.html' % usaco_id
-    testdata_href = 'http://usaco.org/current/data/%s.zip' % usaco_id
-
-    def latexify(statement):
-        for e in statement.find_all_next('ul'):
-            e.insert_before('\n\\begin{itemize}')
-            e.insert_after('\n\\end{itemize}\n')
-            e.unwrap()
-        for e in statement.find_all_next('ol'):
-            e.insert_before('\n\\begin{enumerate}')
-            e.insert_after('\n\\end{enumerate}\n')
-            e.unwrap()
-        for e in statement.find_all_next('li'):
-            e.insert_before('\n\\item ')
-            e.insert_after('\n')
-            e.unwrap()
-        for e in statement.find_all_next('strong'):
-            e.insert_before('\\textbf{')
-            e.insert_after('}')
-            e.unwrap()
-
-    def latexify_post(s, lang):
-        s = re.sub(r"'(.)'", "`\\\\t{\\1}'", s, re.DOTALL)
-        if lang == 'en':
-            s = re.sub(r'\"([^\"]*)\"', "``\\1''", s, re.DOTALL)
-        else:
-            s = re.sub(r'\"([^\"]*)\"', "<<\\1>>", s, re.DOTALL)
-        return s
+def parse_contest(contest):
+    contest_href = contest if contest.startswith('http') else 'http://usaco.org/index.php?page=%s' % contest
+    page = download_web_page(contest_href)
+    problems = []
+    cpid = None
+    for match in re.finditer(r"cpid=(\d+)|data/([\w-]+)\.zip", page):
+        if match.group(1) is not None:
+            cpid = match.group(1)
+        elif cpid is not None:
+            problems.append((cpid, match.group(2)))
+            cpid = None
+    return problems
+
+
+def latexify(statement):
+    for e in statement.find_all_next('ul'):
+        e.insert_before('\n\\begin{itemize}')
+        e.insert_after('\n\\end{itemize}\n')
+        e.unwrap()
+    for e in statement.find_all_next('ol'):
+        e.insert_before('\n\\begin{enumerate}')
+        e.insert_after('\n\\end{enumerate}\n')
+        e.unwrap()
+    for e in statement.find_all_next('li'):
+        e.insert_before('\n\\item ')
+        e.insert_after('\n')
+        e.unwrap()
+    for e in statement.find_all_next('strong'):
+        e.insert_before('\\textbf{')
+        e.insert_after('}')
+        e.unwrap()
+
+
+def latexify_post(s, lang):
+    s = re.sub(r"'(.)'", "`\\\\t{\\1}'", s, re.DOTALL)
+    if lang == 'en':
+        s = re.sub(r'\"([^\"]*)\"', "``\\1''", s, re.DOTALL)
+    else:
+        s = re.sub(r'\"([^\"]*)\"', "<<\\1>>", s, re.DOTALL)
+    return s
 
-    def download_statement():
+
+class UsacoAdapter(SourceAdapter):
+    name = 'usacoimport'
+
+    def __init__(self, cpid, usaco_id):
+        self.cpid = cpid
+        self.usaco_id = usaco_id
+        self.problem_href = 'http://usaco.org/index.php?page=viewproblem2&cpid=%s' % cpid
+        self.solution_href = 'http://usaco.org/current/data/sol_%s.html' % usaco_id
+        self.testdata_href = 'http://usaco.org/current/data/%s.zip' % usaco_id
+        # groupsizes = [] if len(sys.argv) < 5 else [int(x) for x in sys.argv[4].split(',')]
+        self.dir = None
+        self.tests_dir = None
+        self.sample_count = None
+        self.parsed_statements = None
+        self.parsed_solutions = None
+        self.analysis = None
+
+    def commit_message(self):
+        return "usacoimport: %s" % self.usaco_id
+
+    def prepare(self):
+        self.dir = scratch_space.create_directory("__usaco")
+
+    def cleanup(self):
+        for directory in [self.dir, self.tests_dir]:
+            if directory is not None:
+                scratch_space.remove_directory(directory)
+
+    def download_statements(self):
+        if self.parsed_statements is not None:
+            return self.parsed_statements
         sample_count = 1
+        self.parsed_statements = []
         for lang, lang_polygon in [('en', 'english'), ('ru', 'russian')]:
-            page = download_web_page(problem_href + "&lang=%s" % lang)
+            page = download_web_page(self.problem_href + "&lang=%s" % lang)
             reg = re.compile(r".*<h2>\s*Problem\s*\d+\.\s*(\S.*[^<])\s+</h2>.*", re.DOTALL)
             g = reg.match(page)
             name = g.group(1)
@@ -118,7 +163,6 @@ def main():
             # print("Output: " + output.text)
             # print("Scoring: " + scoring.text)
             # print("Note: " + note.text)
-            print("problem.saveStatement language = " + lang_polygon)
             polygon_statement = Statement(encoding="UTF-8",
                                           name=name,
                                           legend=latexify_post(statement.text, lang),
@@ -126,100 +170,134 @@ def main():
                                           output=output,
                                           scoring=scoring,
                                           notes=note)
-            prob.save_statement(lang=lang_polygon, problem_statement=polygon_statement)
-        return sample_count
+            self.parsed_statements.append(StatementItem(lang_polygon, polygon_statement))
+        self.sample_count = sample_count
+        return self.parsed_statements
 
-    def download_tests(dir, tests_dir, sample_count):
-        tests_archive = os.path.join(dir, "tests.zip")
-        download_file_to(testdata_href, tests_archive)
+    def groups(self):
+        self.download_statements()
+        tests_archive = os.path.join(self.dir, "tests.zip")
+        download_file_to(self.testdata_href, tests_archive)
+        scratch_space.charge(os.path.getsize(tests_archive))
         print(tests_archive, "downloaded")
         zip_archive = zipfile.ZipFile(tests_archive, 'r')
         file_list = zip_archive.namelist()
         to_extract = [x for x in file_list if x.endswith('.in')]
-        zip_archive.extractall(path=tests_dir, members=to_extract)
+        tests_dir = self.tests_dir = scratch_space.extract(zip_archive, to_extract, "__usaco_tests")
         print(to_extract, 'extracted to', tests_dir)
         cnt = len(to_extract)
 
-        def file_to_test(name, use_in_statements=False):
-            return Test(FileContents(os.path.join(tests_dir, name)), 'usacoimport: filename = %s' % name,
-                        use_in_statements=use_in_statements)
+        def files_to_tests(first, last, use_in_statements=False):
+            return TestTable([os.path.join(tests_dir, '%d.in' % x) for x in range(first, last + 1)],
+                             lambda path: 'usacoimport: filename = %s' % os.path.basename(path),
+                             use_in_statements=use_in_statements)
 
-        groups = [
-            Group(0, [file_to_test('%d.in' % x, use_in_statements=True) for x in range(1, sample_count + 1)],
-                  GroupScoring.SUM),
-            Group(100, [file_to_test('%d.in' % x) for x in range(sample_count + 1, cnt + 1)], GroupScoring.SUM),
+        return [
+            Group(0, files_to_tests(1, self.sample_count, use_in_statements=True), GroupScoring.SUM),
+            Group(100, files_to_tests(self.sample_count + 1, cnt), GroupScoring.SUM),
         ]
 
-        upload_groups(prob, groups)
-
-    def download_solutions():
-        solution_page = download_web_page(solution_href)
+    def download_solutions(self):
+        if self.parsed_solutions is not None:
+            return self.parsed_solutions
+        solution_page = download_web_page(self.solution_href)
         parser = BeautifulSoup(solution_page, "html.parser")
         solutions = parser.find_all('pre', attrs={'class', 'prettyprint'})
         analysis = parser.find('html')
         if analysis is not None:
             latexify(analysis)
         id = 0
-        tag = SolutionTag.MA
+        self.parsed_solutions = []
         for x in solutions:
             x.extract()
             code = x.text
             id += 1
             is_cpp = '#include' in code
             fname = 'sol%d.%s' % (id, 'cpp' if is_cpp else 'java')
-            try:
-                print('problem.saveSolution name = %s' % fname)
-                prob.save_solution(name=fname,
-                                   file=code,
-                                   source_type="cpp.g++17" if is_cpp else 'java8',
-                                   tag=tag)
-                tag = SolutionTag.OK
-            except PolygonRequestFailedException as e:
-                print("API Error: " + e.comment)
+            self.parsed_solutions.append(SolutionItem(fname, MemoryContents(code), SolutionTag.OK,
+                                                      ["cpp.g++17" if is_cpp else 'java8']))
         for x in parser.find_all('p'):
             x.insert_before('\n')
             x.unwrap()
         for x in parser.find_all('span'):
             x.unwrap()
-        print("problem.saveStatement tutorial lang = english")
         if analysis is not None:
-            prob.save_statement(lang="english",
-                                problem_statement=Statement(tutorial=latexify_post(analysis.text, 'en')))
+            self.analysis = latexify_post(analysis.text, 'en')
+        return self.parsed_solutions
 
-    api = authenticate()
-    print("problems.list id = %s" % polygon_pid)
-    prob = list(api.problems_list(id=polygon_pid))
-    if len(prob) == 0:
-        print("Problem %s not found" % polygon_pid)
-        exit(1)
-    prob = prob[0]
-    print("problem.enablePoints")
-    prob.enable_points(True)
-    print("problem.enableGroups")
-    prob.enable_groups('tests', True)
+    def solutions(self):
+        return self.download_solutions()
 
-    sample_count = download_statement()
+    def statements(self):
+        statements = self.download_statements()
+        self.download_solutions()
+        if self.analysis is not None:
+            print("Tutorial is added to the english statement")
+            for item in statements:
+                if item.lang == "english":
+                    item.statement.tutorial = self.analysis
+        return statements
 
-    tests_dir = os.path.join(dir, "tests")
-    os.mkdir(tests_dir)
-    download_tests(dir, tests_dir, sample_count)
+    def checker(self):
+        return 'std::wcmp.cpp'
 
-    download_solutions()
+    def description(self):
+        return """Imported by usaco-import from %s
+The solution probably uses files, instead of stdin/stdout
+""" % self.problem_href
 
-    print("problem.setChecker std::wcmp.cpp")
-    prob.set_checker('std::wcmp.cpp')
+    def tutorial(self):
+        return self.solution_href
 
-    description = """Imported by usaco-import from %s
-The solution probably uses files, instead of stdin/stdout
-""" % problem_href
-    tutorial = solution_href
-    print("problem.saveGeneralDescription: " + description)
-    prob.save_general_description(description)
-    print("problem.saveGeneralTutorial: " + tutorial)
-    prob.save_general_tutorial(tutorial=tutorial)
-    tags = ['usaco']
-    print("problem.saveTags: " + str(tags))
-    prob.save_tags(tags)
+    def tags(self):
+        return ['usaco']
+
+
+def import_usaco(cpid, usaco_id, polygon_pid, client=None, options=None):
+    """
+    Imports a USACO problem into a Polygon problem in this process, see run_import
+    """
+    return run_import(functools.partial(UsacoAdapter, cpid, usaco_id), polygon_pid, client, options)
+
+
+def main():
+    arguments, options = split_arguments(sys.argv[1:])
+    if len(arguments) != (1 if 'contest' in options else 3):
+        print_usage()
+        exit(239)
+    configure_process(options, print_usage)
+
+    if 'contest' not in options:
+        finish_import(import_usaco(arguments[0], arguments[1], arguments[2], options=options))
+        return
+
+    polygon_pids = arguments[0].split(',')
+    problems = parse_contest(options['contest'])
+    print("Contest problems: %s" % problems)
+    if len(problems) != len(polygon_pids):
+        print("Found %d problems in the contest, but %d polygon problem ids are given"
+              % (len(problems), len(polygon_pids)))
+        exit(1)
+    api = authenticate()
+    with worker_pool(len(problems)) as pool:
+        futures = [pool.submit(import_usaco, cpid, usaco_id, polygon_pid, api, options)
+                   for (cpid, usaco_id), polygon_pid in zip(problems, polygon_pids)]
+    failed = []
+    for ((cpid, usaco_id), polygon_pid), future in zip(zip(problems, polygon_pids), futures):
+        report = future.result()
+        if isinstance(report.exception, ImportAbortedException):
+            print(report.exception.comment)
+        elif report.exception is not None:
+            print("Error: %s" % repr(report.exception))
+        else:
+            report.print_summary()
+        imported = report.succeeded()
+        print("%s (cpid = %s) -> %s: %s" % (usaco_id, cpid, polygon_pid, "imported" if imported else "FAILED"))
+        if not imported:
+            failed.append(polygon_pid)
+    byte_budget.report()
+    if len(failed) > 0:
+        exit(1)
 
 
 if __name__ == "__main__":
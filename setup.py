@@ -21,6 +21,7 @@ setuptools.setup(
     ],
     packages=['polygon_uploader',
               'polygon_uploader.common',
+              'polygon_uploader.domjudge',
               'polygon_uploader.lojac',
               'polygon_uploader.usaco',
     ],
@@ -29,6 +30,7 @@ setuptools.setup(
             'lojacimport=polygon_uploader.lojac:main',
             'usacoimport=polygon_uploader.usaco:main',
             'domjudgeimport=polygon_uploader.domjudge:main',
+            'domjudgeexport=polygon_uploader.domjudge:export_main',
         ]
     },
     classifiers=[
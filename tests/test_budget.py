@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from polygon_uploader.common.budget import ByteBudget
+from polygon_uploader.common.cli import UsageError, parse_size, size_option
+
+
+def acquire_in_thread(budget, size):
+    acquired = threading.Event()
+
+    def run():
+        budget.acquire(size)
+        acquired.set()
+    threading.Thread(target=run, daemon=True).start()
+    return acquired
+
+
+def test_payloads_wait_for_the_budget():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    waiting = acquire_in_thread(budget, 50)
+    assert not waiting.wait(0.2)
+    budget.release(60)
+    assert waiting.wait(5)
+    assert budget.in_flight == 50 and budget.peak == 60
+
+
+def test_oversize_payload_is_admitted_alone():
+    budget = ByteBudget(100)
+    budget.acquire(10)
+    oversize = acquire_in_thread(budget, 250)
+    assert not oversize.wait(0.2)
+    budget.release(10)
+    assert oversize.wait(5)
+    assert budget.peak == 250
+    # nothing else gets in while the oversize payload is in flight
+    small = acquire_in_thread(budget, 1)
+    assert not small.wait(0.2)
+    budget.release(250)
+    assert small.wait(5)
+
+
+def test_small_payload_is_not_stuck_behind_a_big_one():
+    budget = ByteBudget(100)
+    budget.acquire(70)
+    big = acquire_in_thread(budget, 50)
+    small = acquire_in_thread(budget, 20)
+    assert small.wait(5)
+    assert not big.is_set()
+    budget.release(70)
+    assert big.wait(5)
+
+
+def test_unlimited_budget_only_tracks_the_peak():
+    budget = ByteBudget()
+    with budget.reserve(10 ** 12):
+        with budget.reserve(1):
+            assert budget.in_flight == 10 ** 12 + 1
+    assert budget.in_flight == 0 and budget.peak == 10 ** 12 + 1
+
+
+@pytest.mark.parametrize('value, size', [('512', 512), ('4K', 4096), ('1.5M', 3 * 2 ** 19), ('2gb', 2 * 2 ** 30)])
+def test_parse_size(value, size):
+    assert parse_size(value) == size
+
+
+@pytest.mark.parametrize('value', [True, '', '  ', 'lots', 'M'])
+def test_malformed_size_option_is_a_usage_error(value):
+    with pytest.raises(UsageError):
+        size_option({'memory-budget': value}, 'memory-budget')
@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from polygon_api import Polygon
+from requests.adapters import HTTPAdapter
+
+from polygon_uploader.common import cassette, journal, pipeline
+from polygon_uploader.domjudge import import_domjudge
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# recorded from an import of data/domjudge/hello prepared by prepare_package, see record_domjudge_import
+DOMJUDGE_CASSETTE = os.path.join(DATA, 'domjudge_import.zip')
+API_URL = 'http://127.0.0.1:8765/api/'
+POLYGON_PID = '7'
+PACKAGE_TIME = 1700000000
+
+
+def prepare_package(directory):
+    """
+    Copies the package with fixed times and modes, they are stored in its archive, which is one of the requests
+    """
+    package = os.path.join(str(directory), 'hello')
+    shutil.copytree(os.path.join(DATA, 'domjudge', 'hello'), package)
+    for root, directories, files in os.walk(package):
+        for name in files:
+            os.chmod(os.path.join(root, name), 0o644)
+        for name in directories + ['.']:
+            os.chmod(os.path.join(root, name), 0o755)
+        for name in files + directories + ['.']:
+            os.utime(os.path.join(root, name), (PACKAGE_TIME, PACKAGE_TIME))
+    return package
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    """
+    Runs an import in UTC (the times in the archive are local), with its journal in tmp_path,
+    and takes the cassette out of requests afterwards
+    """
+    timezone = os.environ.get('TZ')
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+    monkeypatch.setattr(HTTPAdapter, 'send', HTTPAdapter.send)
+    monkeypatch.setattr(pipeline, 'Journal', functools.partial(journal.Journal, directory=str(tmp_path / 'journal')))
+    try:
+        yield tmp_path
+    finally:
+        if timezone is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = timezone
+        time.tzset()
+
+
+def run_domjudge_import(directory, options):
+    package = prepare_package(directory)
+    installed = cassette.install_cassette(options)
+    try:
+        return import_domjudge(package, POLYGON_PID, client=Polygon(API_URL, 'key', 'secret'),
+                               options={'workers': 4})
+    finally:
+        installed.close()
+
+
+def test_replayed_domjudge_import(isolated):
+    report = run_domjudge_import(isolated, {'replay': DOMJUDGE_CASSETTE})
+    assert report.exception is None, report.errors
+    assert report.errors == []
+    assert report.problem_id == 7
+    done = {phase.name: (phase.done, phase.failed) for phase in report.phases}
+    assert done['tests'] == (4, 0)
+    assert done['solutions'] == (2, 0)
+    assert done['statements'][1] == 0
+    assert not os.path.exists(os.path.join(str(isolated), 'journal', '7.jsonl'))
+
+
+
+class PolygonStub(BaseHTTPRequestHandler):
+    """
+    Answers the Polygon API methods that a DOMjudge import calls, for recording the cassette
+    """
+    protocol_version = 'HTTP/1.1'
+    LISTS = {'problem.solutions', 'problem.tests', 'problem.checkerTests', 'problem.validatorTests',
+             'problem.packages', 'problem.statementResources'}
+    RESULTS = {
+        'problems.list': [{'id': int(POLYGON_PID), 'owner': 'tester', 'name': 'hello', 'deleted': False,
+                           'favourite': False, 'accessType': 'OWNER', 'revision': 1, 'modified': False}],
+        'problem.info': {'inputFile': 'stdin', 'outputFile': 'stdout', 'interactive': False, 'timeLimit': 1000,
+                         'memoryLimit': 256},
+        'problem.statements': {},
+        'problem.files': {'resourceFiles': [], 'sourceFiles': [], 'auxFiles': []},
+    }
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[-1]
+        result = [] if method in self.LISTS else self.RESULTS.get(method)
+        body = json.dumps({'status': 'OK', 'result': result} if result is not None else {'status': 'OK'})
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def record_domjudge_import():
+    """
+    Records DOMJUDGE_CASSETTE again from an import into PolygonStub: python -m tests.test_cassette
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 8765), PolygonStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+    directory = tempfile.mkdtemp()
+    pipeline.Journal = functools.partial(journal.Journal, directory=os.path.join(directory, 'journal'))
+    try:
+        report = run_domjudge_import(directory, {'record': DOMJUDGE_CASSETTE})
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+    report.print_summary()
+    return report.succeeded()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if record_domjudge_import() else 1)
@@ -0,0 +1,115 @@
+import pytest
+from polygon_api import HTTPRequestFailedException, PolygonRequestFailedException
+
+from polygon_uploader.common.credentials import (
+    Credential,
+    CredentialPool,
+    CredentialsExhaustedException,
+    Pin,
+    RevokedException,
+    ShardedPolygon,
+    THROTTLE_COOLDOWN,
+    ThrottledException,
+)
+
+
+def make_pool(*limits):
+    return CredentialPool([Credential(name, 'https://polygon.example/api', 'key-' + name, 'secret',
+                                      requests_per_minute=limit)
+                           for name, limit in zip('abcdef', limits)])
+
+
+def answering(failures):
+    """
+    An action that fails with failures[api_key] (an exception) or returns the name of the key
+    """
+    def action(config):
+        if config.api_key in failures:
+            raise failures[config.api_key]
+        return config.api_key
+    return action
+
+
+def test_acquire_takes_the_least_busy_key():
+    pool = make_pool(None, None)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.name, second.name} == {'a', 'b'}
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_acquire_keeps_every_key_under_its_rate_limit():
+    pool = make_pool(1, None)
+    a = pool.credentials[0]
+    assert pool.acquire() is a
+    pool.release(a)
+    for _ in range(3):
+        credential = pool.acquire()
+        assert credential.name == 'b'
+        pool.release(credential)
+
+
+def test_throttled_key_is_put_aside_and_request_is_sent_again():
+    pool = make_pool(None, None)
+    action = answering({'key-a': ThrottledException('Too many requests')})
+    assert pool.issue(action) == 'key-b'
+    a = pool.credentials[0]
+    assert a.throttles == 1 and not a.revoked
+    assert a.cooldown == 2 * THROTTLE_COOLDOWN
+    assert pool.failovers == 1
+    assert pool.issue(answering({})) == 'key-b'
+
+
+def test_http_429_throttles_and_401_revokes():
+    pool = make_pool(None, None, None)
+    action = answering({'key-a': HTTPRequestFailedException('Method problem.info returned HTTP code 429'),
+                        'key-b': HTTPRequestFailedException('Method problem.info returned HTTP code 401')})
+    assert pool.issue(action) == 'key-c'
+    a, b, _ = pool.credentials
+    assert a.throttles == 1 and not a.revoked
+    assert b.revoked
+
+
+def test_revoked_keys_are_dropped_until_none_is_left():
+    pool = make_pool(None, None)
+    action = answering({'key-a': RevokedException('Invalid apiKey')})
+    assert pool.issue(action) == 'key-b'
+    assert pool.issue(answering({})) == 'key-b'
+    with pytest.raises(CredentialsExhaustedException):
+        pool.issue(answering({'key-b': RevokedException('API key is revoked')}))
+
+
+@pytest.mark.parametrize('failure', [
+    HTTPRequestFailedException('Method problem.saveTest returned HTTP code 403'),
+    HTTPRequestFailedException('Method problem.saveTest returned HTTP code 500'),
+    PolygonRequestFailedException('Incorrect signature'),
+    PolygonRequestFailedException('problemId: Access denied'),
+])
+def test_other_failures_fail_only_the_request(failure):
+    pool = make_pool(None)
+    with pytest.raises(type(failure)):
+        pool.issue(answering({'key-a': failure}))
+    a = pool.credentials[0]
+    assert not a.revoked and a.throttles == 0 and a.in_flight == 0
+
+
+def test_pin_fails_over_only_before_the_first_modifying_request():
+    pool = make_pool(None, None)
+    pin = Pin()
+    assert pool.issue(answering({'key-a': ThrottledException('rate limit')}), pin) == 'key-b'
+    assert pin.credential.name == 'b' and not pin.fixed
+    assert pool.issue(answering({}), pin, modifying=True) == 'key-b'
+    assert pin.fixed
+    # the other key is idle, but the changes of the problem are in the working copy of b
+    assert pool.issue(answering({}), pin) == 'key-b'
+    with pytest.raises(CredentialsExhaustedException):
+        pool.issue(answering({'key-b': RevokedException('Invalid apiKey')}), pin)
+
+
+def test_unpinned_client_refuses_modifying_requests():
+    api = ShardedPolygon(make_pool(None, None))
+    with pytest.raises(PolygonRequestFailedException):
+        api._request('problem.saveTest', {'problemId': 1})
+    assert all(credential.requests == 0 for credential in api.pool.credentials)
+    assert api.pinned().pin is not None
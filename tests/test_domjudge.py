@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from polygon_uploader.common import GroupScoring
+from polygon_uploader.domjudge import domjudge
+
+SUM = GroupScoring.SUM
+GROUP = GroupScoring.GROUP
+
+
+def test_archive_size_bounds_the_payload_and_its_copy(tmp_path):
+    os.makedirs(tmp_path / 'data' / 'sample')
+    os.makedirs(tmp_path / 'data' / 'secret')
+    (tmp_path / 'problem.yaml').write_text('name: test\n')
+    (tmp_path / 'data' / 'sample' / 'random.bin').write_bytes(os.urandom(100000))
+    for i in range(20):
+        (tmp_path / 'data' / 'sample' / ('%d.in' % i)).write_bytes(b'')
+    (tmp_path / 'data' / 'secret' / 'big.in').write_bytes(os.urandom(100000))
+    archive = domjudge.ArchiveContents(str(tmp_path))
+    data = archive()
+    # the headers make the archive of incompressible data larger than its files
+    assert len(data) > 100000 + len('name: test\n')
+    assert 2 * len(data) <= archive.size()
+    assert b'big.in' not in data
+
+
+@pytest.mark.parametrize('inherited, own, count, expected', [
+    # legacy settings: accept_score per test, the whole group for min, or the upper end of range
+    ({}, {}, 4, (4, SUM)),
+    ({'accept_score': 2.5}, {}, 3, (7.5, SUM)),
+    ({'grader_flags': 'min'}, {'accept_score': 20}, 5, (20, GROUP)),
+    ({}, {'range': '0 30'}, 5, (30, SUM)),
+    # a range set above the group only caps the score of its own tests
+    ({'range': '0 100', 'grader_flags': 'min'}, {'accept_score': 20}, 5, (20, GROUP)),
+    ({'range': '0 100', 'grader_flags': 'min'}, {'accept_score': 200}, 5, (100, GROUP)),
+    ({'range': '0 100'}, {}, 5, (5, SUM)),
+    ({'range': '0 100'}, {'range': '0 40'}, 5, (40, SUM)),
+    # current settings
+    ({}, {'scoring': {'score': 25, 'aggregation': 'min'}}, 3, (25, GROUP)),
+    ({'scoring': {'score': 100}}, {'accept_score': 10}, 3, (30, SUM)),
+])
+def test_testdata_group(inherited, own, count, expected):
+    score, scoring = domjudge.testdata_group(dict(inherited, **own), count, own)
+    assert (score, scoring) == expected
+    assert isinstance(score, int) == float(expected[0]).is_integer()
+
+
+def test_subgroups_keep_their_scores_under_a_package_range(tmp_path):
+    secret = tmp_path / 'data' / 'secret'
+    (tmp_path / 'problem.yaml').write_text('type: scoring\n')
+    os.makedirs(secret)
+    (secret / 'testdata.yaml').write_text('range: 0 100\ngrader_flags: min\n')
+    for name, score in [('group1', 30), ('group2', 70)]:
+        os.makedirs(secret / name)
+        (secret / name / 'testdata.yaml').write_text('accept_score: %d\n' % score)
+        for i in range(3):
+            (secret / name / ('%d.in' % i)).write_text('%d\n' % i)
+    adapter = domjudge.DomjudgeAdapter(str(tmp_path), {})
+    groups = adapter.groups()
+    assert [(group.score, group.scoring) for group in groups[1:]] == [(30, GROUP), (70, GROUP)]
@@ -0,0 +1,62 @@
+import json
+
+from polygon_uploader.common.journal import Journal, JournaledProblem, operation_hash
+
+
+class RecordingProblem:
+    def __init__(self):
+        self.calls = []
+
+    def save_test(self, *args, **kwargs):
+        self.calls.append(('save_test', args, kwargs))
+
+    def tests(self, testset):
+        self.calls.append(('tests', (testset,), {}))
+        return []
+
+
+def test_torn_tail_is_dropped_on_resume(tmp_path):
+    journal = Journal(7, directory=str(tmp_path))
+    first = operation_hash('save_test', ('tests', 1, '1\n'), {})
+    second = operation_hash('save_test', ('tests', 2, '2\n'), {})
+    journal.record(first, 'save_test')
+    journal.record(second, 'save_test')
+    path = tmp_path / '7.jsonl'
+    complete = path.read_bytes()
+    # the process died while writing the third record
+    path.write_bytes(complete + b'{"problem": "7", "op": "abc')
+
+    resumed = Journal(7, resume=True, directory=str(tmp_path))
+    assert resumed.done == {first, second}
+    assert path.read_bytes() == complete
+    third = operation_hash('save_test', ('tests', 3, '3\n'), {})
+    resumed.record(third, 'save_test')
+    lines = path.read_bytes().splitlines()
+    assert [json.loads(line)['op'] for line in lines] == [first, second, third]
+
+
+def test_resume_skips_done_operations_and_clear_forgets_them(tmp_path):
+    prob = RecordingProblem()
+    journaled = JournaledProblem(prob, Journal(7, directory=str(tmp_path)))
+    journaled.save_test('tests', 1, '1\n', test_group=0)
+    prob.calls.clear()
+
+    resumed = Journal(7, resume=True, directory=str(tmp_path))
+    journaled = JournaledProblem(prob, resumed)
+    journaled.save_test('tests', 1, '1\n', test_group=0)
+    journaled.save_test('tests', 1, '1\n', test_group=1)
+    journaled.tests('tests')
+    assert [(name, args[1:2], kwargs) for name, args, kwargs in prob.calls] == [
+        ('save_test', (1,), {'test_group': 1}),
+        ('tests', (), {}),
+    ]
+    resumed.clear()
+    assert not (tmp_path / '7.jsonl').exists()
+    assert Journal(7, resume=True, directory=str(tmp_path)).done == set()
+
+
+def test_fresh_import_starts_a_new_journal(tmp_path):
+    journal = Journal(7, directory=str(tmp_path))
+    journal.record(operation_hash('enable_points', (True,), {}), 'enable_points')
+    assert Journal(7, directory=str(tmp_path)).done == set()
+    assert (tmp_path / '7.jsonl').read_bytes() == b''
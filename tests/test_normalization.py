@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+from polygon_uploader.common import normalization
+
+
+def normalize(data, chunk_size, strip_spaces=False):
+    destination = io.BytesIO()
+    fixes = normalization.normalize_stream(io.BytesIO(data), destination, strip_spaces=strip_spaces,
+                                           chunk_size=chunk_size)
+    return destination.getvalue(), fixes
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 1 << 20])
+@pytest.mark.parametrize('data, strip_spaces, expected, fixes', [
+    (b'1 2\n3 4\n', False, b'1 2\n3 4\n', []),
+    (b'1 2\r\n3 4\r\n', False, b'1 2\n3 4\n', ['line endings']),
+    (b'1\r\r\n2\r', False, b'1\n\n2\n', ['line endings']),
+    (b'1\r\n\r\n2', False, b'1\n\n2\n', ['final newline', 'line endings']),
+    (b'1 2 \t\r\n3  \n', True, b'1 2\n3\n', ['line endings', 'trailing spaces']),
+    (b'1 2 \t\r\n3  \n', False, b'1 2 \t\n3  \n', ['line endings']),
+    (b'5 \t ', True, b'5\n', ['final newline', 'trailing spaces']),
+    (b'', False, b'', []),
+])
+def test_line_endings_split_across_chunks(data, strip_spaces, expected, fixes, chunk_size):
+    assert normalize(data, chunk_size, strip_spaces) == (expected, fixes)
+
+
+def test_every_split_of_crlf_gives_one_newline():
+    data = b'a\r\nb\r\nc\r\n' * 7
+    for chunk_size in range(1, len(data) + 1):
+        assert normalize(data, chunk_size) == (b'a\nb\nc\n' * 7, ['line endings'])
@@ -0,0 +1,47 @@
+import threading
+
+from polygon_api import PolygonRequestFailedException
+
+from polygon_uploader.common import polygon
+
+
+class PolygonTests:
+    """
+    The tests of a Polygon problem, save_test with check_existing fails for a test that is already there
+    """
+
+    def __init__(self, stored=None):
+        self.stored = dict(stored or {})
+        self.saves = []
+        self.lock = threading.Lock()
+
+    def save_test(self, testset, test_index, test_input, check_existing=None, **kwargs):
+        with self.lock:
+            self.saves.append((test_index, check_existing))
+            if check_existing and test_index in self.stored:
+                raise PolygonRequestFailedException('testIndex: Test with index %d already exists' % test_index)
+            self.stored[test_index] = test_input.encode('utf-8')
+
+    def test_input(self, testset, test_index, binary=False):
+        return self.stored[test_index]
+
+    def save_test_group(self, testset, group, **kwargs):
+        pass
+
+
+def upload(prob, inputs):
+    saved = []
+    failed = []
+    tests = [polygon.Test(polygon.MemoryContents(data), 'test %d' % i) for i, data in enumerate(inputs)]
+    group = polygon.Group(100, tests, polygon.GroupScoring.SUM)
+    polygon.upload_groups(prob, [group], on_saved=lambda: saved.append(1), on_failed=failed.append)
+    return len(saved), failed
+
+
+def test_tests_saved_without_a_record_are_taken_over():
+    prob = PolygonTests({1: b'1\n', 2: b'other\n'})
+    saved, failed = upload(prob, ['1\n', '2\n', '3\n'])
+    assert saved == 2
+    assert len(failed) == 1 and failed[0].startswith('test 2 [test 1]: ')
+    assert prob.saves == [(1, True), (1, False), (2, True), (3, True)]
+    assert prob.stored == {1: b'1\n', 2: b'other\n', 3: b'3\n'}